@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+##
+#   batch.py
+#
+#   Copyright (C) David McNaughton 2023-present
+#
+#   a utility to pack or unpack a whole library of CP/M (2.2) disk image files (*.dsk, *.hdd)
+#   in parallel, one image per process, skipping those whose output is already up to date
+#
+#   usage:
+#       python3 batch.py pack|unpack [options] <dir|glob|image> ...
+#
+#       pack        - repack each <name>.unpacked into <name>.dsk|.hdd, the format is taken
+#                     from the existing image (or --ext for a new one)
+#       unpack      - unpack each image into <name>.unpacked, a stale tree is replaced
+#
+#       --jobs N    - number of processes (default: one per core)
+#       --hash      - decide up to date by content hash (kept in batch.json) not mtime
+#       --force     - redo every image
+#       --trim      - unpack: cut text files at their ^Z (see unpack.py)
+#       --ext .EXT  - pack: the image type for a tree with no image yet (default .dsk)
+#
+#   dependencies:
+#       python3
+#       pack.py, unpack.py          - alongside this file
+#
+#   history:
+#        17-OCT-2026     1.0     Initial release
+##
+
+import sys
+import os
+import io
+import glob
+import json
+import time
+import shutil
+import hashlib
+import logging
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import geometry
+import pack
+import unpack
+
+UNPACKED = '.unpacked'
+MANIFEST = 'batch.json'
+
+
+# THE IMAGES (pack: THE TREES) NAMED BY A DIRECTORY, GLOB OR PATH
+def find_images(paths, mode, ext):
+
+    found = [ ]
+    for p in paths:
+        if os.path.isdir(p) and not p.rstrip(os.sep).endswith(UNPACKED):
+            names = [ os.path.join(p, n) for n in sorted(os.listdir(p)) ]
+        else:
+            names = sorted(glob.glob(p)) or [ p ]
+
+        for n in names:
+            n = n.rstrip(os.sep)
+            root, e = os.path.splitext(n)
+            if mode == 'unpack':
+                if e in geometry.EXTS and os.path.isfile(n):
+                    found.append(n)
+            elif e == UNPACKED and os.path.isdir(n):
+                images = [ root + x for x in geometry.EXTS if os.path.isfile(root + x) ]
+                found.extend(images or [ root + ext ])
+            elif e in geometry.EXTS and os.path.isdir(root + UNPACKED):
+                found.append(n)
+
+    found = list(dict.fromkeys(found))
+
+    # <name>.dsk AND <name>.hdd WOULD SHARE ONE <name>.unpacked TREE, SO NEITHER IS TAKEN
+    stems = { }
+    for n in found:
+        stems.setdefault(os.path.splitext(n)[0], [ ]).append(n)
+    clashes = [ v for v in stems.values() if len(v) > 1 ]
+    if len(clashes):
+        sys.exit('\n'.join(f'{" and ".join(v)} share {os.path.splitext(v[0])[0] + UNPACKED} - rename one' for v in clashes))
+
+    return found
+
+
+# EVERY FILE AND DIRECTORY OF A TREE, THE DIRECTORIES FOR RENAMES AND DELETES
+def tree_entries(root):
+    yield root
+    for (path, dirs, files) in os.walk(root):
+        dirs.sort()
+        for n in dirs + sorted(files):
+            yield os.path.join(path, n)
+
+def mtime(path):
+    if os.path.isdir(path):
+        return max(os.stat(e).st_mtime for e in tree_entries(path))
+    return os.stat(path).st_mtime
+
+def digest(path):
+    h = hashlib.sha256()
+    if os.path.isdir(path):
+        for e in tree_entries(path):
+            h.update(os.path.relpath(e, path).encode() + b'\0')
+            if os.path.isfile(e):
+                with open(e, 'rb') as f:
+                    h.update(hashlib.sha256(f.read()).digest())
+    else:
+        with open(path, 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+# ONE IMAGE, IN A WORKER PROCESS - RETURNS (image, result, seconds, hash of the input or None)
+def run_one(mode, image, force, use_hash, known, trim):
+
+    start = time.perf_counter()
+    root = os.path.splitext(image)[0]
+    src, dst = (root + UNPACKED, image) if mode == 'pack' else (image, root + UNPACKED)
+
+    try:
+        h = digest(src) if use_hash else None
+
+        if not force and os.path.exists(dst):
+            if use_hash:
+                current = (known == h)
+            else:
+                current = mtime(dst) >= mtime(src)
+            if current:
+                return (image, 'up to date', time.perf_counter() - start, h)
+
+        # THE LISTINGS AND LOGGING OF pack/unpack ARE NOT WANTED FROM MANY PROCESSES AT ONCE
+        logging.disable(logging.INFO)
+        with contextlib.redirect_stdout(io.StringIO()):
+            if mode == 'pack':
+                pack.pack(image, replace=True)
+                result = 'packed'
+            else:
+                tmp = dst + '.tmp'
+                shutil.rmtree(tmp, ignore_errors=True)
+                unpack.unpack(root, trim, tmp, ext=os.path.splitext(image)[1])
+                if os.path.exists(dst):
+                    shutil.rmtree(dst)
+                os.rename(tmp, dst)
+                result = 'unpacked'
+
+        # THE HASH IS OF THE INPUT AS USED - pack MAY HAVE RENAMED FILES IN THE TREE
+        if use_hash and mode == 'pack':
+            h = digest(src)
+        return (image, result, time.perf_counter() - start, h)
+
+    except SystemExit as e:
+        return (image, f'FAILED: {e}', time.perf_counter() - start, None)
+    except Exception as e:
+        return (image, f'FAILED: {e!r}', time.perf_counter() - start, None)
+
+
+def main():
+
+    args = sys.argv[1:]
+
+    if len(args) < 2 or args[0] not in ('pack', 'unpack'):
+        sys.exit(f'usage: {os.path.basename(sys.argv[0])} pack|unpack [--jobs N] [--hash] [--force] [--trim] [--ext .EXT] <dir|glob|image> ...')
+
+    mode = args.pop(0)
+    jobs = os.cpu_count()
+    use_hash = force = trim = False
+    ext = '.dsk'
+    paths = [ ]
+
+    while args:
+        a = args.pop(0)
+        if a == '--jobs' and args:
+            jobs = int(args.pop(0))
+        elif a == '--hash':
+            use_hash = True
+        elif a == '--force':
+            force = True
+        elif a == '--trim':
+            trim = True
+        elif a == '--ext' and args:
+            ext = args.pop(0)
+            if ext not in geometry.EXTS:
+                sys.exit(f'UNKNOWN IMAGE TYPE: {ext}')
+        else:
+            paths.append(a)
+
+    images = find_images(paths, mode, ext)
+    if len(images) == 0:
+        sys.exit('NO IMAGES FOUND')
+
+    manifest = { }
+    if use_hash:
+        try:
+            with open(MANIFEST) as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            pass
+    hashes = manifest.setdefault(mode, { })
+
+    start = time.perf_counter()
+    results = [ ]
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        work = [ pool.submit(run_one, mode, i, force, use_hash, hashes.get(os.path.abspath(i)), trim) for i in images ]
+        for w in as_completed(work):
+            (image, result, secs, h) = w.result()
+            results.append((image, result, secs))
+            if h != None:
+                hashes[os.path.abspath(image)] = h
+
+    if use_hash:
+        with open(MANIFEST, 'w') as f:
+            json.dump(manifest, f, indent=4)
+
+    width = max(12, max(len(i) for i in images))
+    print(f'{"IMAGE":{width}} {"RESULT":12} {"TIME":>8}')
+    print(f'{"-" * width} {"-" * 12} {"-" * 8}')
+    for (image, result, secs) in sorted(results):
+        print(f'{image:{width}} {result:12} {secs:7.2f}s')
+
+    count = { }
+    for (image, result, secs) in results:
+        r = result.split(':')[0]
+        count[r] = count.get(r, 0) + 1
+    print()
+    print(', '.join(f'{n} {r}' for (r, n) in count.items()) + f' - {len(images)} images in {time.perf_counter() - start:.2f}s with {jobs} processes')
+
+    if 'FAILED' in count:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        # do nothing here
+        print("KEY INT")
+        pass
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+##
+#   cpmdir.py
+#
+#   Copyright (C) David McNaughton 2023-present
+#
+#   the CP/M (2.2) directory engine shared by pack.py, unpack.py and fifDirSrv.py
+#
+#   the directory area is parsed in one pass with struct.iter_unpack, the extents are
+#   kept in compact arrays (user, name, xNum, rc, block pointers) and the files built
+#   from them are __slots__ records, indexed as before ie. dir[user][FILENAME.EXT]
+#
+#   dependencies:
+#       python3
+#
+#   known issues:
+#       - user numbers above 15 (eg. CP/M 3 labels and time stamps) are kept in the
+#         extent arrays but not made into files
+#
+#   history:
+#        17-OCT-2026     1.0     Initial release
+##
+
+import sys
+import struct
+import bisect
+from array import array
+from logging import warning
+
+DEL_BYTE = 0xE5
+EXT_SZ = 32
+USERS = 16
+
+# USER, NAME+EXT, XL, BC, XH, RC, THEN 16 8-BIT OR 8 16-BIT BLOCK POINTERS - AND THE POINTERS ALONE
+EXT8 = struct.Struct('<B11sBBBB16B')
+EXT16 = struct.Struct('<B11sBBBB8H')
+ALLOC = struct.Struct('16x16s')
+
+
+def xNum(xl, xh):
+    return ((xh & 0x2F) << 5) | (xl & 0x1F)
+
+
+class File:
+    """A file in the directory, built from all its extents in directory order
+
+    - blocks : count of allocated blocks
+    - recs : count of 128 byte records
+    - data : the block pointers of all the extents, including the 0 (unused) ones
+    - exts : the index of each of its extents in the directory
+    """
+    __slots__ = ('blocks', 'recs', 'data', 'exts')
+
+    def __init__(self):
+        self.blocks = 0
+        self.recs = 0
+        self.data = array('H')
+        self.exts = array('H')
+
+
+class Directory:
+    """The parsed directory area of a disk, dir[user] is a dict of FILENAME.EXT -> File"""
+    __slots__ = ('blkMode', 'ext', 'ptrs', 'user', 'name', 'xnum', 'rc', 'alloc', 'files', 'names')
+
+    def __init__(self, dirData, blkMode):
+
+        n = len(dirData) // EXT_SZ
+        view = memoryview(dirData)[: n * EXT_SZ]
+
+        self.blkMode = blkMode
+        self.ext = EXT16 if blkMode else EXT8
+        self.ptrs = 8 if blkMode else 16
+        self.files = [ {} for _ in range(USERS) ]
+        self.names = { }
+
+        # EACH FIELD OF EVERY EXTENT IN ONE PASS, THEN ONLY THE LIVE EXTENTS ARE MADE INTO FILES
+        self.user = array('B', view[0::EXT_SZ])
+        self.rc = array('B', view[15::EXT_SZ])
+        self.xnum = array('H', map(xNum, view[12::EXT_SZ], view[14::EXT_SZ]))
+
+        alloc = b''.join([ e[0] for e in ALLOC.iter_unpack(view) ])
+        if blkMode:
+            self.alloc = array('H')
+            self.alloc.frombytes(alloc)
+            if sys.byteorder == 'big':
+                self.alloc.byteswap()
+        else:
+            self.alloc = array('H', iter(alloc))
+
+        self.name = [ None ] * n
+        raw = bytes(view)
+        ptrs = self.ptrs
+        for d in range(n):
+            user = self.user[d]
+            if user == DEL_BYTE:
+                continue
+
+            pos = d * EXT_SZ
+            filename = self.names.get(raw[pos + 1: pos + 12])
+            if filename == None:
+                filename = self.filename(raw[pos + 1: pos + 12])
+            self.name[d] = filename
+
+            if user < USERS:
+                f = self.files[user].get(filename)
+                if f == None:
+                    f = self.files[user][filename] = File()
+                blocks = self.alloc[d * ptrs: (d + 1) * ptrs]
+                f.blocks += ptrs - blocks.count(0)
+                f.recs += self.rc[d]
+                f.data.extend(blocks)
+                f.exts.append(d)
+            else:
+                warning(f'***UNKNOWN Entry: {d:02} User: {user:02X} Filename: {filename} xNum: {self.xnum[d]} Len(rc): {self.rc[d]} Bps: {list(self.pointers(d))}')
+
+    def __getitem__(self, user):
+        return self.files[user]
+
+    def __len__(self):
+        return len(self.files)
+
+    # FILENAME.EXT AS IT IS KEYED, SPACE PADDED AND WITH ANY ATTRIBUTE BITS, DECODED ONCE PER NAME
+    def filename(self, name):
+        filename = self.names.get(name)
+        if filename == None:
+            filename = self.names[name] = name[0:8].decode('latin-1') + '.' + name[8:11].decode('latin-1')
+        return filename
+
+    def pointers(self, d):
+        return self.alloc[d * self.ptrs: (d + 1) * self.ptrs]
+
+    def add(self, f, d):
+        ptrs = self.pointers(d)
+        f.blocks += len(ptrs) - ptrs.count(0)
+        f.recs += self.rc[d]
+        f.data.extend(ptrs)
+        f.exts.append(d)
+
+    def key(self, d):
+        return (self.user[d], self.name[d])
+
+    # APPLY ONE CHANGED EXTENT - ONLY THE FILE(S) IT BELONGED TO BEFORE AND AFTER ARE REBUILT
+    # RETURNS [ (user, filename, old block pointers) ] OF THE FILES REBUILT
+    def update(self, d, extData):
+
+        e = self.ext.unpack(extData)
+        before = self.key(d)
+        after = (e[0], self.filename(e[1]))
+
+        rebuilt = [ ]
+        for (user, filename) in dict.fromkeys([ before, after ]):
+            if user < USERS:
+                f = self.files[user].get(filename)
+                rebuilt.append((user, filename, f.data if f != None else array('H')))
+
+        if before[0] < USERS:
+            self.files[before[0]][before[1]].exts.remove(d)
+
+        n = self.ptrs
+        self.user[d] = e[0]
+        self.name[d] = after[1]
+        self.xnum[d] = xNum(e[2], e[4])
+        self.rc[d] = e[5]
+        self.alloc[d * n: (d + 1) * n] = array('H', e[6:])
+
+        if after[0] < USERS:
+            f = self.files[after[0]].get(after[1])
+            if f == None:
+                f = self.files[after[0]][after[1]] = File()
+            bisect.insort(f.exts, d) # KEEP THE EXTENTS IN DIRECTORY ORDER
+
+        for (user, filename, data) in rebuilt:
+            f = self.files[user][filename]
+            exts = f.exts
+            if len(exts) == 0:
+                del self.files[user][filename]
+                continue
+            f.blocks = 0
+            f.recs = 0
+            f.data = array('H')
+            f.exts = array('H')
+            for x in exts:
+                self.add(f, x)
+
+        return rebuilt
+
+
+# PARSE DIRECTORY EXTENTS INTO dir ARRAY OF DICTIONARIES ie. USER:FILE.EXT
+def parseDir(dirData, blkMode):
+    return Directory(dirData, blkMode)
+
+
+def hostFilename(f):
+    """Strip the space padding from a directory key FILENAME.EXT to give the host filename"""
+    fn = f.split('.',1)
+    fn[0] = fn[0].strip()
+    fn[1] = fn[1].strip()
+    return '.'.join(fn)
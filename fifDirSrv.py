@@ -10,7 +10,30 @@
 #   dependencies:
 #       python3
 #       requests (module)           - to install, use: pip install requests
-#       simple_http_server (module) - to install, use: pip install simple_http_server
+#       iosrv.py                    - the IO callback endpoint and DMA client, alongside this file
+#       cpmdir.py                   - the CP/M directory engine, alongside this file
+#       geometry.py                 - the disk formats and their translation tables, alongside this file
+#
+#   options:
+#       -W [threshold]              - write-back cache for image units, flushed
+#                                     by track every 0.5s or at threshold dirty sectors
+#       --headless                  - run without the curses UI eg. as a systemd service,
+#                                     status goes to stdout and trace.log,
+#                                     SIGHUP reloads the diskmap, SIGTERM shuts down
+#       --host url                  - the IMSAI8080esp to register with (http://imsai8080),
+#                                     repeat to serve more boards from this one process
+#       --port port                 - the port to listen on (3253)
+#       --diskmap file              - the diskmap to load (diskmap.json), after a --host
+#                                     it is the diskmap of that board (diskmap-<hostname>.json)
+#       --config file               - a JSON file of the above eg. { "headless": true, "host": "http://imsai8080" }
+#                                     or for many boards { "boards": [ { "host": "http://imsai1", "diskmap": "imsai1.json" }, ... ] }
+#       -v                          - verbose, log every sector to trace.log
+#
+#   each board has its own FIF descriptors, diskmap and units, callbacks are matched to
+#   the board by the address they come from, 0-9 selects the board shown in the UI
+#
+#   the last 4096 FIF commands are kept in a binary trace ring buffer, dumped to
+#   trace.log and trace.bin on any error, on ^T or on SIGUSR1 (headless)
 #
 #   TODO:
 #       - normalize the use of trk:sec vs. linear sector
@@ -30,13 +53,18 @@ import sys
 import os
 from stat import *
 import socket
-from simple_http_server import route, server, Response, BytesBody, ModelDict, logger as httpdlog
-from threading import Thread
+import iosrv
+from urllib.parse import urlsplit
+from threading import Thread, RLock, Event
 from logging import debug, info, error, warning
 import logging
 import json
-
-httpdlog.set_level("ERROR")
+import mmap
+import time
+import signal
+import struct
+from cpmdir import parseDir, hostFilename
+import geometry
 
 srv = os.path.splitext(os.path.basename(sys.argv[0]))[0]
 
@@ -49,13 +77,178 @@ _srvurl = f'http://{socket.gethostname()}:{SRV_PORT}/{SRV_PATH}'
 
 diskmap_file = 'diskmap.json'
 
-disks = { }
 disk_to_unit = { 'A': 1, 'B': 2, 'C': 4, 'D': 8, 'I': 15 }
 
-sess = requests.Session()
+# ONE ENTRY PER IMSAI8080esp, ITS UNITS ARE KEYED IN unit_info AS (board index << 4) | unit
+boards = [ ]
+MAX_BOARDS = 16
+board = 0       # the board shown and edited in the UI
 
 TMAX = 77
 win = None
+headless = False
+RED = GREEN = YELLOW = CYAN = 0
+
+# FIF COMMAND TRACE - FIXED SIZE RING BUFFER OF BINARY RECORDS
+#   time (s), unit, cmd, track, sector, result, service time (ms)
+verbose = False
+TRACE_REC = struct.Struct('<dBBBBBf')
+TRACE_LEN = 4096
+trace_buf = bytearray(TRACE_REC.size * TRACE_LEN)
+trace_count = 0
+
+# DISPLAY STATE - THE REQUEST PATH ONLY RECORDS THE LATEST EVENT PER ITEM,
+# THE RENDER THREAD COALESCES THEM AND REDRAWS AT FPS
+FPS = 20
+ui_lock = RLock()
+ui = { 'recv': None, 'color': 0, 'recvs': 0, 'desc': 0, 'wb': 0, 'track': { }, 'cmd': { }, 'res': { }, 'action': { } }
+ui_shown = { 'recvs': 0, 'desc': 0, 'wb': 0, 'track': { }, 'cmd': { }, 'res': { }, 'action': { } }
+
+# WRITE-BACK CACHE FOR IMG UNITS - ENABLED WITH -W [threshold]
+writeback = False
+WB_INTERVAL = 0.5       # seconds between timed flushes
+WB_THRESHOLD = 64       # dirty sectors that trigger an early flush
+wb_lock = RLock()
+wb_event = Event()
+wb_stats = { 'dirty': 0, 'peak': 0, 'flushes': 0, 'sectors': 0, 'batches': 0, 'last': 0.0, 'max': 0.0, 'total': 0.0 }
+
+
+def parse_args():
+
+    global headless, hosturl, SRV_PORT, _srvurl, diskmap_file
+    global writeback, WB_THRESHOLD, verbose
+
+    args = sys.argv[1:]
+    info(f"Args: {args} [{len(args)}]")
+
+    opts = { }
+
+    if "--config" in args:
+        i = args.index("--config")
+        if len(args) > i + 1:
+            try:
+                with open(args[i+1], "r") as fp:
+                    opts = json.load(fp)
+                info(f"CONFIG: {args[i+1]} {opts}")
+            except (json.decoder.JSONDecodeError, FileNotFoundError) as e:
+                sys.exit(f'FAILED to load config {args[i+1]}: {e}')
+
+    if "--port" in args:
+        i = args.index("--port")
+        if len(args) > i + 1:
+            opts['port'] = args[i+1]
+
+    # EACH --host ADDS A BOARD, A --diskmap AFTER IT IS FOR THAT BOARD
+    hosts = [ ]
+    for i, a in enumerate(args[:-1]):
+        if a == "--host":
+            hosts.append({ 'host': args[i+1] })
+        elif a == "--diskmap":
+            if hosts:
+                hosts[-1]['diskmap'] = args[i+1]
+            else:
+                opts['diskmap'] = args[i+1]
+    if hosts:
+        opts['boards'] = hosts
+
+    if "--headless" in args:
+        opts['headless'] = True
+
+    if "-v" in args:
+        opts['verbose'] = True
+
+    if "-W" in args:
+        opts['writeback'] = True
+        i = args.index("-W")
+        if len(args) > i + 1 and args[i+1].isnumeric():
+            opts['threshold'] = args[i+1]
+
+    headless = bool(opts.get('headless', headless))
+    hosturl = opts.get('host', hosturl)
+    SRV_PORT = int(opts.get('port', SRV_PORT))
+    _srvurl = f'http://{socket.gethostname()}:{SRV_PORT}/{SRV_PATH}'
+    diskmap_file = opts.get('diskmap', diskmap_file)
+
+    for b in opts.get('boards', [ { 'host': hosturl } ]):
+        add_board(b.get('host', hosturl), b.get('diskmap'))
+    verbose = bool(opts.get('verbose', verbose))
+
+    writeback = bool(opts.get('writeback', writeback))
+    WB_THRESHOLD = int(opts.get('threshold', WB_THRESHOLD))
+    if writeback:
+        info(f"WRITE-BACK: selected threshold={WB_THRESHOLD} interval={WB_INTERVAL}s")
+
+
+def add_board(host, diskmap=None):
+
+    if len(boards) == MAX_BOARDS:
+        sys.exit(f"FAILED to add {host} - no more than {MAX_BOARDS} boards")
+
+    if diskmap == None:
+        diskmap = diskmap_file if len(boards) == 0 else f"diskmap-{urlsplit(host).hostname}.json"
+
+    boards.append({ 'index': len(boards), 'host': host, 'addr': None, 'dma': iosrv.client(host), 'diskmap': diskmap,
+                    'disks': { }, 'fdstate': 0, 'descno': 0, 'fdaddr': [0] * 16 })
+    info(f"BOARD {len(boards) - 1}: {host} {diskmap}")
+
+
+# CALLBACKS ARE MATCHED TO THE BOARD REGISTERED FROM THAT ADDRESS
+def find_board(peer):
+
+    for b in boards:
+        if b['addr'] == peer:
+            return b
+
+    # A SINGLE BOARD IS SERVED WHEREVER ITS CALLBACKS COME FROM (eg. THROUGH A PROXY OR NAT)
+    if len(boards) == 1:
+        return boards[0]
+
+    return None
+
+
+def status(msg):
+    info(msg)
+    if headless:
+        print(msg, flush=True)
+
+
+def daemon():
+
+    reload = Event()
+    dump = Event()
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    if hasattr(signal, 'SIGHUP'):
+        signal.signal(signal.SIGHUP, lambda signum, frame: reload.set())
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, lambda signum, frame: dump.set())
+
+    status(f"Remote IMSAI FIF - {srv} (headless)")
+
+    for b in boards:
+        load_diskmap(b)
+
+        process_diskmap(b)
+
+        connect_to_host(b)
+
+    if writeback:
+        wb = Thread(target=wb_flusher, daemon=True)
+        wb.start()
+
+    th = Thread(target=iosrv.run, args=(f'/{SRV_PATH}', io_out, SRV_PORT), daemon=True)
+    th.start()
+
+    while True:
+        if reload.wait(1.0):
+            reload.clear()
+            for b in boards:
+                status(f"RELOAD: {b['host']} {b['diskmap']}")
+                load_diskmap(b)
+                process_diskmap(b)
+        if dump.is_set():
+            dump.clear()
+            status(f"TRACE DUMP: {min(trace_count, TRACE_LEN)} records")
+            trace_dump('SIGUSR1')
 
 
 def main(sc):
@@ -83,164 +276,183 @@ def main(sc):
     sc.refresh()
     win = curses.newwin(curses.LINES - 2 , TMAX , 1, 1)
 
-    load_diskmap()
+    for b in boards:
+        load_diskmap(b)
+
+        process_diskmap(b)
+
+        connect_to_host(b)
 
-    process_diskmap()
+    if writeback:
+        wb = Thread(target=wb_flusher, daemon=True)
+        wb.start()
 
-    connect_to_host()
+    rt = Thread(target=render, daemon=True)
+    rt.start()
 
     ## DONT RUN THIS IN A VM OR THE HOST CAN'T BE SEEN
-    th = Thread(target=server.start, args=("", SRV_PORT), daemon=True)
+    th = Thread(target=iosrv.run, args=(f'/{SRV_PATH}', io_out, SRV_PORT), daemon=True)
     th.start()
 
+    global board
+
     drive = None
 
     while True:
         key = win.getkey()
-        win.addstr(curses.LINES - 3, 1, f"KEY: <{key}>", CYAN)
-        win.clrtoeol()
-        win.refresh()
-
-        # info(f"KEY: {key} len={len(key)} ord={ord(key)}")
-        if key == chr(24): # ^X
-            connect_to_host()
-        elif key == chr(16): # ^P
-            info(f"PERSIST: {disks}")
-            with open(diskmap_file, "w") as fp:
-                json.dump(disks, fp)  # encode disks dict into JSON 
-            win.addstr(curses.LINES - 3, 12, f"SAVED TO {diskmap_file}")
-        elif key == chr(18): # ^R
-            info(f"RELOAD: {disks}")
-            load_diskmap()   
-            process_diskmap()
-        elif key == chr(21): # ^U
-            if drive in list(disks):
-                info(f"UNLOAD: DSK:{drive}: {disks[drive]}")        
-                disks.pop(drive)          
-                process_diskmap()
-        elif key == chr(12): # ^L
-            if drive in list(disk_to_unit):
-                info(f"LOAD: DSK:{drive}:")
-                # PROMPT USER FOR image/directory NAME USING TEXTBOX
-                win.addstr(curses.LINES - 3, 0, f"LOAD: DSK:{drive}: = ")
-                win.clrtoeol()
-                win.refresh()
-                curses.curs_set(1)
-                txtwin = curses.newwin(1 , TMAX - 32 , curses.LINES - 2, 16)
-                tb = curses.textpad.Textbox(txtwin, insert_mode=True)
-                txt = tb.edit()
-                curses.curs_set(0)
-                txt = txt.strip()
-                disks[drive] = txt
-                process_diskmap()
-        elif key in list(disk_to_unit):
-            drive = key
-            win.addstr(curses.LINES - 3, 10, f"DRIVE: DSK:{drive}:")
-            continue
+
+        with ui_lock:
+            b = boards[board]
+            disks = b['disks']
+            win.addstr(curses.LINES - 3, 1, f"KEY: <{key}>", CYAN)
+            win.clrtoeol()
+            win.refresh()
+
+            # info(f"KEY: {key} len={len(key)} ord={ord(key)}")
+            if key == chr(24): # ^X
+                connect_to_host(b)
+            elif key == chr(16): # ^P
+                info(f"PERSIST: {disks}")
+                with open(b['diskmap'], "w") as fp:
+                    json.dump(disks, fp)  # encode disks dict into JSON 
+                win.addstr(curses.LINES - 3, 12, f"SAVED TO {b['diskmap']}")
+            elif key == chr(20): # ^T
+                trace_dump('^T')
+                win.addstr(curses.LINES - 3, 12, "TRACE DUMPED TO trace.log")
+            elif key == chr(18): # ^R
+                info(f"RELOAD: {disks}")
+                load_diskmap(b)   
+                process_diskmap(b)
+            elif key == chr(21): # ^U
+                if drive in list(disks):
+                    info(f"UNLOAD: DSK:{drive}: {disks[drive]}")        
+                    disks.pop(drive)          
+                    process_diskmap(b)
+            elif key == chr(12): # ^L
+                if drive in list(disk_to_unit):
+                    info(f"LOAD: DSK:{drive}:")
+                    # PROMPT USER FOR image/directory NAME USING TEXTBOX
+                    win.addstr(curses.LINES - 3, 0, f"LOAD: DSK:{drive}: = ")
+                    win.clrtoeol()
+                    win.refresh()
+                    curses.curs_set(1)
+                    txtwin = curses.newwin(1 , TMAX - 32 , curses.LINES - 2, 16)
+                    tb = curses.textpad.Textbox(txtwin, insert_mode=True)
+                    txt = tb.edit()
+                    curses.curs_set(0)
+                    txt = txt.strip()
+                    disks[drive] = txt
+                    process_diskmap(b)
+            elif len(key) == 1 and key.isdigit() and int(key) < len(boards):
+                board = int(key)
+                drawBoard()
+            elif key in list(disk_to_unit):
+                drive = key
+                win.addstr(curses.LINES - 3, 10, f"DRIVE: DSK:{drive}:")
+                continue
 
         drive = None
         
 
-@route(f'/{SRV_PATH}', method="PUT")
-def io_out_put(p, m=ModelDict()):
-    port = int(p, 16)
-    #BODY is a little hard to get as it ends up as the first KEY in the DICT m
-    data = int(next(iter(m)), 16) 
+async def io_out(method, port, body, peer):
+    b = find_board(peer)
+    if b == None:
+        warning(f"IO FROM UNKNOWN BOARD: {peer}")
+        return 404
+    if method == 'POST':
+        return await io_out_post(b, port, body)
+    return await io_out_put(b, port, body)
+
+async def io_out_put(b, port, body):
+    #BODY is the data byte in hex, sent form encoded
+    data = int(body.split(b'=')[0], 16) 
     # info(f'{port:02X} {data:02X}')
     if port == FIF_PORT:
-        t = fif_out(data)
+        t = await fif_out(b, data)
 
         if t == 1:
-            return Response(status_code=201)
-    return #normal 200 response 
-
-@route(f'/{SRV_PATH}', method="POST")
-def io_out_post(p, b=BytesBody()):
-    port = int(p, 16)
-    data = bytearray(b) 
-    info(f'{port:02X} {data}')
+            return 201
+    return 200
+
+async def io_out_post(b, port, body):
+    data = bytearray(body) 
+    if verbose:
+        info(f'{port:02X} {data}')
     if port == FIF_PORT:
-        t = fif_with_dma(data)
+        t = await fif_with_dma(b, data)
 
         if t == 1:
-            return Response(status_code=201)
-    return #normal 200 response 
+            return 201
+    return 200
 
-def connect_to_host():
+def connect_to_host(b):
 
-    sys_get = requests.delete(f'{hosturl}/io?p={FIF_PORT:02X}')
-    if sys_get.status_code == 200:
-        info(f'De-registered on {sys_get.text}')
-        win.addnstr(0, 0, f'De-registered on {sys_get.text}', TMAX)
+    hosturl = b['host']
+    shown = not headless and b['index'] == board
 
     try:
+        b['addr'] = socket.gethostbyname(urlsplit(hosturl).hostname)
+
+        sys_get = requests.delete(f'{hosturl}/io?p={FIF_PORT:02X}')
+        if sys_get.status_code == 200:
+            status(f'De-registered on {sys_get.text}')
+            if shown:
+                win.addnstr(0, 0, f'De-registered on {sys_get.text}', TMAX)
+
         sys_get = requests.patch(f'{hosturl}/io?p=-{FIF_PORT:02X}&b=0x0F', data=_srvurl)
         # sys_get = requests.patch(f'{hosturl}/io?p=-{FIF_PORT:02X}', data=_srvurl)
         if sys_get.status_code == 200:
-            info(f'Listening and registered on Port {FIF_PORT:02X}h to {sys_get.text}')
-            win.addnstr(0, 0, f'Listening and registered on Port {FIF_PORT:02X}h to {sys_get.text}', TMAX, GREEN)
-            win.addnstr(1, 0, f'***You must COLD BOOT the IMSAI to recognize the remote FIF***', TMAX, YELLOW)
-            win.refresh()
+            status(f'Listening and registered on Port {FIF_PORT:02X}h to {sys_get.text}')
+            status('***You must COLD BOOT the IMSAI to recognize the remote FIF***')
+            if shown:
+                win.addnstr(0, 0, f'Listening and registered on Port {FIF_PORT:02X}h to {sys_get.text}', TMAX, GREEN)
+                win.addnstr(1, 0, '***You must COLD BOOT the IMSAI to recognize the remote FIF***', TMAX, YELLOW)
+                win.refresh()
     except:
-        sys.exit(f"FAILED to find {hosturl} - not connected")
+        if len(boards) == 1:
+            sys.exit(f"FAILED to find {hosturl} - not connected")
+        # ONE BOARD BEING DOWN DOES NOT STOP THE OTHERS BEING SERVED
+        error(f"FAILED to find {hosturl} - not connected")
+        status(f"*** FAILED to find {hosturl} - not connected, ^X to retry ***")
 
-fdstate = 0
-descno = 0
-fdaddr = [0] * 16
+async def fif_with_dma(b, mem):
 
-def fif_with_dma(mem):
-
-    global descno
-    global fdstate
-    global fdaddr
+    fdaddr = b['fdaddr']
 
     res = 0
 
-    win.addstr(2, 0, 'RECV', curses.A_REVERSE + GREEN)
-    win.refresh()
+    dispRecv(GREEN)
 
-    descno = mem[9]
+    descno = b['descno'] = mem[9]
     fdaddr[descno] = (mem[8] << 8) + mem[7]
 
-    win.addstr(1, 0, f"FIF DESC:{descno:X}")
-    win.clrtoeol()
-    win.move(2,4)
-    win.clrtoeol()
-    for i in range(16):
-        win.addstr((i//8) + 1, (i%8) * 7 + 12, f"{i:X}:{fdaddr[i]:04X}", curses.A_BOLD if i == descno else curses.A_NORMAL)
+    dispDesc()
 
-    res = disk_io_action(mem, fdaddr[descno])
+    res = await disk_io_action(b, mem, fdaddr[descno])
 
-    win.addstr(2, 0, '    ')
-    win.refresh()
+    dispRecv(None)
     return res
 
-def fif_out(data):
+async def fif_out(b, data):
 
-    global descno
-    global fdstate
-    global fdaddr
+    fdaddr = b['fdaddr']
+    descno = b['descno']
+    fdstate = b['fdstate']
 
     res = 0
 
-    win.addstr(2, 0, 'RECV', curses.A_REVERSE + RED)
-    win.refresh()
+    dispRecv(RED)
 
     if fdstate == 0:
         op = data & 0xF0
         if op == 0x00:
             descno = data & 0x0F
-            res = disk_io(fdaddr[descno])
+            res = await disk_io(b, fdaddr[descno])
         elif op == 0x10:
             descno = data & 0x0F
             fdstate += 1
 
-        win.addstr(1, 0, f"FIF DESC:{descno:X}")
-        win.clrtoeol()
-        win.move(2,4)
-        win.clrtoeol()
-        for i in range(16):
-            win.addstr((i//8) + 1, (i%8) * 7 + 12, f"{i:X}:{fdaddr[i]:04X}", curses.A_BOLD if i == descno else curses.A_NORMAL)
+        dispDesc()
 
     elif fdstate == 1:
         fdaddr[descno] = data
@@ -253,10 +465,136 @@ def fif_out(data):
         error(f'Internal error fdstate={fdstate}')
         fdstate = 0
 
-    win.addstr(2, 0, '    ')
-    win.refresh()
+    b['descno'] = descno
+    b['fdstate'] = fdstate
+
+    dispRecv(None)
     return res
 
+def dispRecv(color):
+    ui['recv'] = color
+    if color != None:
+        ui['color'] = color
+        ui['recvs'] += 1
+
+def dispDesc():
+    ui['desc'] += 1
+
+
+# RENDER THREAD - DRAW WHATEVER HAS CHANGED IN THE DISPLAY STATE SINCE THE LAST FRAME
+def render():
+    while True:
+        time.sleep(1 / FPS)
+        with ui_lock:
+            drawFrame()
+            win.refresh()
+
+def drawFrame():
+
+    # KEEP RECV LIT FOR A FRAME IF ANY REQUEST ARRIVED, HOWEVER SHORT
+    if ui['recv'] != None or ui['recvs'] != ui_shown['recvs']:
+        win.addstr(2, 0, 'RECV', curses.A_REVERSE + ui['color'])
+    else:
+        win.addstr(2, 0, '    ')
+    ui_shown['recvs'] = ui['recvs']
+
+    b = boards[board]
+    descno = b['descno']
+    fdaddr = b['fdaddr']
+
+    if ui['desc'] != ui_shown['desc']:
+        ui_shown['desc'] = ui['desc']
+        win.addstr(1, 0, f"FIF DESC:{descno:X}")
+        win.clrtoeol()
+        win.move(2,4)
+        win.clrtoeol()
+        for i in range(16):
+            win.addstr((i//8) + 1, (i%8) * 7 + 12, f"{i:X}:{fdaddr[i]:04X}", curses.A_BOLD if i == descno else curses.A_NORMAL)
+
+    if ui['wb'] != ui_shown['wb']:
+        ui_shown['wb'] = ui['wb']
+        drawWriteBack()
+
+    units = [ (board << 4) | u for u in disk_to_unit.values() ]
+
+    for unit, cmd in list(ui['cmd'].items()):
+        if cmd != ui_shown['cmd'].get(unit) and unit in units:
+            ui_shown['cmd'][unit] = cmd
+            (c, track, sector, dma_addr) = cmd
+            win.addstr(4*units.index(unit) + 3, 35, f"{cmd_str[c]:6} TRK:{(track+1):3} SEC:{sector:3} DMA: {dma_addr:04X}h")
+
+    for unit, res in list(ui['res'].items()):
+        if res != ui_shown['res'].get(unit) and unit in units:
+            ui_shown['res'][unit] = res
+            win.addstr(4*units.index(unit) + 3, 69, f"RES: {res:02X}")
+
+    for unit, track in list(ui['track'].items()):
+        if track != ui_shown['track'].get(unit) and unit in units:
+            drawTrack(units.index(unit), unit, track, ui_shown['track'].get(unit))
+            ui_shown['track'][unit] = track
+
+    for unit, desc in list(ui['action'].items()):
+        if desc != ui_shown['action'].get(unit) and unit in units:
+            ui_shown['action'][unit] = desc
+            win.addstr(4*units.index(unit) + 6, 0, desc)
+            win.clrtoeol()
+
+def drawTrack(i, unit, track, last):
+
+    geo = unit_info[unit]['geo']
+    tscale = unit_info[unit]['scale']
+    (trk, sec, mode, type) = track
+
+    if last:
+        win.addstr(4*i + 4, last[0] >> tscale, '.')
+        win.addstr(4*i + 5, last[0] >> tscale, ' ')
+
+    # IMAGE AND LOCAL UNITS SHOW BOOT/DIRECTORY/EXTENT, DIR UNITS SHOW THE USER OF THE FILE
+    if type == None:
+        s = trk * geo.dpb['sectors'] + sec - 1
+        lsec = geo.lsec[s] if 0 <= s < len(geo.lsec) else geo.dirsecs
+
+        ind = 'B' if trk < geo.dpb['offset'] else 'D' if lsec < geo.dirsecs else 'E' 
+        win.addstr(4*i + 4, trk >> tscale, mode)
+        win.addstr(4*i + 5, trk >> tscale, ind)
+    else:
+        win.addstr(4*i + 4, trk >> tscale, mode, curses.A_BOLD)
+        win.addstr(4*i + 5, trk >> tscale, type, curses.A_BOLD)
+
+def resetDisplay(units):
+    for k in [ 'track', 'cmd', 'res', 'action' ]:
+        for unit in units:
+            ui[k].pop(unit, None)
+            ui_shown[k].pop(unit, None)
+
+# DRAW THE UNITS OF THE BOARD SHOWN, THE RENDER THREAD THEN FILLS IN THEIR STATE
+def drawBoard():
+
+    b = boards[board]
+
+    win.move(5,0)
+    win.clrtobot()
+
+    if len(boards) > 1:
+        win.addnstr(0, 0, f"BOARD {board}: {b['host']} {b['diskmap']}", TMAX, GREEN)
+        win.clrtoeol()
+
+    for i, d in enumerate(disk_to_unit):
+        unit = (board << 4) | disk_to_unit[d]
+        tscale = unit_info[unit]['scale']
+
+        win.addstr(4*i + 3, 0, f"DSK:{d}: =  {unit_info[unit]['type']}:{unit_info[unit]['file']}")
+        win.addstr(4*i + 3, 35, "Login/Warm boot to reload disk", curses.A_DIM + YELLOW)
+        win.hline(4*i + 4, 0, '.', unit_info[unit]['dpb']['tracks'] >> tscale)
+        if tscale:
+            win.addstr(4*i + 4, (unit_info[unit]['dpb']['tracks'] >> tscale), f' [x{1 << tscale}]')
+
+    for k in [ 'track', 'cmd', 'res', 'action' ]:
+        ui_shown[k].clear()
+    ui_shown['desc'] = None
+
+    win.refresh()
+
 cmd_str = [ "", "WRITE", "READ", "FORMAT", "VERIFY" ]
 
 DEL_BYTE = 0xE5
@@ -264,113 +602,216 @@ EOF_BYTE = 0x1A
 EXT_SZ = 32
 SEC_SZ = 128
 
-trans8 = [ 1,7,13,19,25,5,11,17,23,3,9,15,21,2,8,14,20,26,6,12,18,24,4,10,16,22 ]
-
-dpb8 = { 
-    'sectors': 26,
-    'blksize': 1024,
-    'dirsize': 64,
-    'disksize': 243,
-    'offset': 2,
-    'tracks': 77
-}
-
-dpbHD = { 
-    'sectors': 128,
-    'blksize': 2048,
-    'dirsize': 1024,
-    'disksize': 2040,
-    'offset': 0,
-    'tracks': 255
-}
-
 dph = { 
-    1: { 'dpb': dpb8, 'trans': trans8 },
-    2: { 'dpb': dpb8, 'trans': trans8 },
-    4: { 'dpb': dpb8, 'trans': trans8 },
-    8: { 'dpb': dpb8, 'trans': trans8 },
-    15: { 'dpb': dpbHD }
+    1: geometry.FD8,
+    2: geometry.FD8,
+    4: geometry.FD8,
+    8: geometry.FD8,
+    15: geometry.HD
 }
 
 unit_info = { }
 
 
-def load_diskmap():
-    global disks
+def load_diskmap(b):
+
+    diskmap_file = b['diskmap']
 
     try:
         with open(diskmap_file, "r") as fp:
-            disks = json.load(fp) # Load the disks dict from the file
-        info(f"LOADED: {disks}")
-        win.addstr(2, 0, f"Loaded: {diskmap_file}")
+            b['disks'] = json.load(fp) # Load the disks dict from the file
+        status(f"LOADED: {b['disks']}")
+        if not headless and b['index'] == board:
+            win.addstr(2, 0, f"Loaded: {diskmap_file}")
     except json.decoder.JSONDecodeError as e:
         error(f'JSON error in {diskmap_file}: {e}')
         sys.exit(f'JSON error in {diskmap_file}: {e}')
     except FileNotFoundError:
         warning(f'Diskmap file {diskmap_file} not found')
-        win.addstr(2, 0, f"*** Warning: no {diskmap_file} file found ***")
+        if headless:
+            print(f"*** Warning: no {diskmap_file} file found ***", flush=True)
+        elif b['index'] == board:
+            win.addstr(2, 0, f"*** Warning: no {diskmap_file} file found ***")
 
 
-def process_diskmap():
+def process_diskmap(b):
 
-    win.move(5,0)
-    win.clrtobot()
+    with ui_lock:
+        _process_diskmap(b)
 
-    info('DISKS:')
-    for i, d in enumerate(disk_to_unit):
+def _process_diskmap(b):
+
+    disks = b['disks']
+    units = { d: (b['index'] << 4) | disk_to_unit[d] for d in disk_to_unit }
+
+    resetDisplay(units.values())
 
-        unit_info[disk_to_unit[d]] = {}
+    status(f"DISKS: {b['host']}" if len(boards) > 1 else 'DISKS:')
+    for d in disk_to_unit:
+
+        unit = units[d]
+        image_close(unit)
+        unit_info[unit] = {}
 
         if d in list(disks):
             dstat = os.stat(disks[d])
 
             if S_ISREG(dstat.st_mode):
-                info(f'DSK:{d}: = IMAGE: {disks[d]}')
-                unit_info[disk_to_unit[d]]['type'] = 'IMG'
-                unit_info[disk_to_unit[d]]['file'] = disks[d]
-                unit_info[disk_to_unit[d]]['dpb'] = dph[disk_to_unit[d]]['dpb']
-                if 'trans' in dph[disk_to_unit[d]]:
-                    unit_info[disk_to_unit[d]]['trans'] = dph[disk_to_unit[d]]['trans']
-                unit_info[disk_to_unit[d]]['last'] = 0
+                status(f'DSK:{d}: = IMAGE: {disks[d]}')
+                unit_info[unit]['type'] = 'IMG'
+                unit_info[unit]['file'] = disks[d]
+                unit_info[unit]['geo'] = dph[disk_to_unit[d]]
+                unit_info[unit]['dpb'] = dph[disk_to_unit[d]].dpb
+                image_open(unit)
             elif S_ISDIR(dstat.st_mode):
-                info(f'DSK:{d}: = PATH : {disks[d]}')
-                unit_info[disk_to_unit[d]]['type'] = 'DIR'
-                unit_info[disk_to_unit[d]]['file'] = disks[d]
-                unit_info[disk_to_unit[d]]['dpb'] = dph[disk_to_unit[d]]['dpb']
-                if 'trans' in dph[disk_to_unit[d]]:
-                    unit_info[disk_to_unit[d]]['trans'] = dph[disk_to_unit[d]]['trans']
-                unit_info[disk_to_unit[d]]['last'] = 0
-                (boot, data) = build_directory(disks[d], unit_info[disk_to_unit[d]]['dpb'])
-                dir = parseDir(data, 1 if dph[disk_to_unit[d]]['dpb']['disksize'] > 255 else 0)
-                unit_info[disk_to_unit[d]]['boot'] = boot
-                unit_info[disk_to_unit[d]]['dirdata'] = data
-                unit_info[disk_to_unit[d]]['dir'] = dir
-                unit_info[disk_to_unit[d]]['buffer'] = [ ]
-
-                printDir(dir, dph[disk_to_unit[d]]['dpb']['blksize'])
+                status(f'DSK:{d}: = PATH : {disks[d]}')
+                unit_info[unit]['type'] = 'DIR'
+                unit_info[unit]['file'] = disks[d]
+                unit_info[unit]['geo'] = dph[disk_to_unit[d]]
+                unit_info[unit]['dpb'] = dph[disk_to_unit[d]].dpb
+                (boot, data) = build_directory(disks[d], unit_info[unit]['dpb'])
+                dir = parseDir(data, 1 if dph[disk_to_unit[d]].dpb['disksize'] > 255 else 0)
+                unit_info[unit]['boot'] = boot
+                unit_info[unit]['dirdata'] = data
+                unit_info[unit]['dir'] = dir
+                unit_info[unit]['blkmap'] = buildBlockMap(dir)
+                unit_info[unit]['buffer'] = [ ]
+
+                printDir(dir, dph[disk_to_unit[d]].dpb['blksize'])
             else:
                 sys.exit(f"FAILED drive {d}: file {disks[d]} - not recognized")
         else:
-            unit_info[disk_to_unit[d]]['type'] = 'LOCAL'
-            unit_info[disk_to_unit[d]]['file'] = ''
-            unit_info[disk_to_unit[d]]['dpb'] = dph[disk_to_unit[d]]['dpb']
-            unit_info[disk_to_unit[d]]['last'] = 0
+            unit_info[unit]['type'] = 'LOCAL'
+            unit_info[unit]['file'] = ''
+            unit_info[unit]['geo'] = dph[disk_to_unit[d]]
+            unit_info[unit]['dpb'] = dph[disk_to_unit[d]].dpb
 
         tscale = 0
-        while (unit_info[disk_to_unit[d]]['dpb']['tracks'] >> tscale) > TMAX:
+        while (unit_info[unit]['dpb']['tracks'] >> tscale) > TMAX:
             tscale += 1
-        unit_info[disk_to_unit[d]]['scale'] = tscale
-
-        win.addstr(4*i + 3, 0, f"DSK:{d}: =  {unit_info[disk_to_unit[d]]['type']}:{unit_info[disk_to_unit[d]]['file']}")
-        win.addstr(4*i + 3, 35, f"Login/Warm boot to reload disk", curses.A_DIM + YELLOW)
-        win.hline(4*i + 4, 0, '.', unit_info[disk_to_unit[d]]['dpb']['tracks'] >> tscale)
-        if tscale:
-            win.addstr(4*i + 4, (unit_info[disk_to_unit[d]]['dpb']['tracks'] >> tscale), f' [x{1 << tscale}]')
+        unit_info[unit]['scale'] = tscale
 
-    win.refresh()
+    if not headless and b['index'] == board:
+        drawBoard()
     # debug(unit_info)
 
 
+# MAP AN IMAGE FILE INTO MEMORY ONCE, SECTORS ARE THEN SERVED DIRECTLY FROM THE MAPPING
+def image_open(unit):
+
+    fd = open(unit_info[unit]['file'], 'r+b')
+    try:
+        mm = mmap.mmap(fd.fileno(), 0)
+    except ValueError:
+        fd.close()
+        sys.exit(f"FAILED to map {unit_info[unit]['file']} - empty image file")
+
+    unit_info[unit]['fd'] = fd
+    unit_info[unit]['image'] = mm
+    unit_info[unit]['dirty'] = { }
+
+
+# THE MAPPING OF AN OPEN IMAGE, TO BE CALLED UNDER wb_lock - A UNIT CLOSED BY A DISKMAP RELOAD
+# WHILE A REQUEST WAS IN FLIGHT IS AN ERROR FOR THAT REQUEST, NOT A SLICE OF A CLOSED mmap
+def image_mapping(unit):
+    mm = unit_info.get(unit, {}).get('image')
+    if mm == None:
+        raise IOError(f'IMAGE CLOSED: {unit}')
+    return mm
+
+
+# MSYNC AND RELEASE THE MAPPING OF AN IMAGE FILE
+def image_close(unit):
+
+    with wb_lock:
+        if unit_info.get(unit, {}).get('image') == None:
+            return
+
+        wb_flush([unit])
+
+        info(f"IMAGE SYNC: {unit} {unit_info[unit]['file']}")
+        unit_info[unit]['image'].flush()
+        unit_info[unit]['image'].close()
+        unit_info[unit]['fd'].close()
+        unit_info[unit]['image'] = None
+        unit_info[unit]['fd'] = None
+
+
+def image_close_all():
+    for unit in list(unit_info):
+        image_close(unit)
+
+    if writeback:
+        info(f"WRITE-BACK STATS: {wb_stats}")
+
+
+# WRITE ALL DIRTY SECTORS INTO THE MAPPING AND MSYNC THEM ONE TRACK AT A TIME
+def wb_flush(units=None):
+
+    with wb_lock:
+        start = time.perf_counter()
+        sectors = 0
+        batches = 0
+
+        for unit in (units if units != None else list(unit_info)):
+            dirty = unit_info[unit].get('dirty')
+            if not dirty:
+                continue
+
+            mm = unit_info[unit]['image']
+            trklen = unit_info[unit]['dpb']['sectors'] * SEC_SZ
+
+            tracks = { }
+            for pos in sorted(dirty):
+                tracks.setdefault(pos // trklen, []).append(pos)
+
+            for trk in tracks:
+                for pos in tracks[trk]:
+                    mm[pos: pos + len(dirty[pos])] = dirty[pos]
+
+                # msync OFFSET MUST BE ALIGNED TO THE ALLOCATION GRANULARITY
+                first = tracks[trk][0] - (tracks[trk][0] % mmap.ALLOCATIONGRANULARITY)
+                last = tracks[trk][-1] + SEC_SZ
+                mm.flush(first, last - first)
+
+                sectors += len(tracks[trk])
+                batches += 1
+
+            dirty.clear()
+
+        wb_stats['dirty'] = 0
+
+        if sectors == 0:
+            return
+
+        elapsed = (time.perf_counter() - start) * 1000
+        wb_stats['flushes'] += 1
+        wb_stats['sectors'] += sectors
+        wb_stats['batches'] += batches
+        wb_stats['last'] = elapsed
+        wb_stats['max'] = max(wb_stats['max'], elapsed)
+        wb_stats['total'] += elapsed
+
+    info(f"WRITE-BACK FLUSH: {sectors} sectors in {batches} track batches {elapsed:.2f}ms")
+
+
+def wb_flusher():
+    while True:
+        wb_event.wait(WB_INTERVAL)
+        wb_event.clear()
+        flushes = wb_stats['flushes']
+        wb_flush()
+        if wb_stats['flushes'] != flushes:
+            ui['wb'] += 1
+
+
+def drawWriteBack():
+    avg = wb_stats['total'] / wb_stats['flushes'] if wb_stats['flushes'] else 0.0
+    win.addstr(curses.LINES - 4, 0, f"W-BACK: dirty:{wb_stats['dirty']:4} peak:{wb_stats['peak']:4} flushes:{wb_stats['flushes']} " +
+                                    f"last:{wb_stats['last']:.1f}ms max:{wb_stats['max']:.1f}ms avg:{avg:.1f}ms", curses.A_DIM)
+    win.clrtoeol()
+
+
 def shorten(name, list):
 
     tx = str.maketrans("<>.,;:=?*[]%|()/\\_", "                  ")
@@ -533,55 +974,31 @@ def filename(buf, strip = True):
     return filename
 
 
-# PARSE DIRECTORY EXTENTS INTO dir ARRAY OF DICTIONARIES ie. USER:FILE.EXT
-def parseDir(dirData, blkMode):
-
-    dir = [ {} for _ in range(16) ]
-
-    for d in range(len(dirData) // EXT_SZ):
+# APPLY ONE CHANGED EXTENT TO THE DIRECTORY MODEL AND BLOCK MAP
+# ONLY THE FILE(S) THE EXTENT BELONGED TO BEFORE AND AFTER ARE REBUILT, NOT THE WHOLE DIRECTORY
+def updateDir(unit, lext, extData):
 
-        dirExt = dirData[ d * EXT_SZ : (d + 1) * EXT_SZ ]
-
-        user = dirExt[ 0 ]
-        filename = ''
-        for f in range(8):
-            filename += chr(dirExt[ 1 + f ])
-
-        filename += '.'
-        for e in range(3):
-            filename += chr(dirExt[ 9 + e ])
-
-        xl = dirExt[ 12 ]
-        bc = dirExt[ 13 ]
-        xh = dirExt[ 14 ]
-        rc = dirExt[ 15 ]
-
-        blkcount = 0
-        if blkMode:
-            blocks = []
-            for b in range(0, 16, 2):
-                bp = dirExt[ 16 + b ] | (dirExt[ 17 + b ] << 8)
-                if bp:
-                    blkcount += 1
-                blocks.append(bp)
-        else:
-            blocks = dirExt[ 16 : 32 ]
-            for a in range(16):
-                if dirExt[ 16 + a ]:
-                    blkcount += 1
+    dirdata = unit_info[unit]['dirdata']
+    dir = unit_info[unit]['dir']
+    blkmap = unit_info[unit]['blkmap']
 
-        # info(f'Entry: {d:02} User: {user:02X} Filename: {filename} Ext(xl:xh): {xl:02X}:{xh:02X} Len(bc:rc): {bc}:{rc} Bps: {list(blocks)}')
+    dirdata[lext * EXT_SZ: (lext + 1) * EXT_SZ] = extData
+    rebuilt = dir.update(lext, extData)
 
-        if user != DEL_BYTE:
-            # info(f'Entry: {d:02} User: {user:02X} Filename: {filename} Ext(xl:xh): {xl:02X}:{xh:02X} Len(bc:rc): {bc}:{rc} Bps: {list(blocks)}')
+    # RELEASE THE BLOCKS CLAIMED BY THE FILES BEFORE THEY WERE REBUILT, THEN CLAIM THEM AGAIN
+    for (user, filename, data) in rebuilt:
+        fn = hostFilename(filename)
+        for b in data:
+            if b and blkmap.get(b, (None, None))[0:2] == (user, fn):
+                del blkmap[b]
 
-            if dir[user].get(filename) == None:
-                dir[user][filename] = { 'blocks': 0, "recs": 0, "data": [] }
-            
-            dir[user][filename]['blocks'] += blkcount
-            dir[user][filename]['recs'] += rc
-            dir[user][filename]['data'].extend(blocks)
-    return dir
+    for (user, filename, data) in rebuilt:
+        if filename in dir[user]:
+            data = dir[user][filename].data
+            fn = hostFilename(filename)
+            for b in data:
+                if b and b not in blkmap:
+                    blkmap[b] = (user, fn, data[0])
 
 
 # PRINT DIRECTORY
@@ -594,8 +1011,24 @@ def printDir(dir, blksize):
             info('Name         Bytes   Recs')
             info('------------ ------ ------')
             for f in dir[u]:
-                size = dir[u][f]['blocks']*(blksize//1024)
-                info(f"{f} {size:5}K {dir[u][f]['recs']:5}")
+                size = dir[u][f].blocks*(blksize//1024)
+                info(f"{f} {size:5}K {dir[u][f].recs:5}")
+
+
+# BUILD REVERSE INDEX OF DATA BLOCKS ie. BLOCK -> (USER, FILE.EXT, BASE BLOCK)
+def buildBlockMap(dir):
+
+    blkmap = { }
+
+    for u in range(16):
+        for f in dir[u]:
+            data = dir[u][f].data
+            fn = hostFilename(f)
+            for b in data:
+                # FIRST FILE TO CLAIM A BLOCK WINS, AS THE LINEAR SEARCH DID
+                if b and b not in blkmap:
+                    blkmap[b] = (u, fn, data[0])
+    return blkmap
 
 
 current_file = { 'file': '', 'mode': '', 'fd': None }
@@ -632,48 +1065,41 @@ def write_sector(unit, trk, sec, data):
         writeDirSector(unit, trk, sec, data)
 
 def dispFileSector(unit, trk, sec, mode):
-
-    dpb = unit_info[unit]['dpb']
-    tscale = unit_info[unit]['scale']
-    i = list(unit_info).index(unit)
-    win.addstr(4*i + 4, unit_info[unit]['last'] >> tscale, '.')
-    win.addstr(4*i + 5, unit_info[unit]['last'] >> tscale, ' ')
-    unit_info[unit]['last'] = trk
-    win.addstr(4*i + 4, trk >> tscale, mode)
-
-    if 'trans' in unit_info[unit]:
-        tsec = unit_info[unit]['trans'].index(sec)
-    else:
-        tsec = sec - 1
-
-    dtest = ((trk - dpb['offset']) * dpb['sectors'] + tsec) < (dpb['dirsize'] * EXT_SZ // SEC_SZ)
-    ind = 'B' if trk < dpb['offset'] else 'D' if dtest else 'E' 
-    win.addstr(4*i + 5, trk >> tscale, ind)
-    win.refresh()
+    ui['track'][unit] = (trk, sec, mode, None)
 
 def writeFileSector(unit, trk, sec, data):
 
-    info(f"IMAGE WRITE: {unit}:{trk}:{sec} {unit_info[unit]['file']}")
+    if verbose:
+        info(f"IMAGE WRITE: {unit}:{trk}:{sec} {unit_info[unit]['file']}")
     dispFileSector(unit, trk, sec, 'W')
 
-    dpb = unit_info[unit]['dpb']
+    # THE UI THREAD MAY CLOSE THE MAPPING (image_close) - IT IS ONLY USED UNDER wb_lock
+    with wb_lock:
+        mm = image_mapping(unit)
+        pos = (trk * unit_info[unit]['dpb']['sectors'] + sec - 1) * SEC_SZ
 
-    fd = open(unit_info[unit]['file'], 'r+b')
+        if pos + len(data) > len(mm):
+            error(f"IMAGE WRITE BEYOND END: {unit}:{trk}:{sec} {unit_info[unit]['file']}")
+            return
+
+        if not writeback:
+            mm[pos: pos + len(data)] = data
+            return
 
-    pos = (trk * dpb['sectors'] + sec - 1) * SEC_SZ
+        dirty = unit_info[unit]['dirty']
+        if pos not in dirty:
+            wb_stats['dirty'] += 1
+            wb_stats['peak'] = max(wb_stats['peak'], wb_stats['dirty'])
+        dirty[pos] = data
 
-    fd.seek(pos)
-    fd.write(data)
-    fd.close()
+    if wb_stats['dirty'] >= WB_THRESHOLD:
+        wb_event.set()
 
 def lsec(e):
     return e['lsec']
 
 def dispDirAction(unit, desc):
-    i = list(unit_info).index(unit)
-    win.addstr(4*i + 6, 0, f"<DIR> - {desc}")
-    win.clrtoeol()
-    win.refresh()
+    ui['action'][unit] = f"<DIR> - {desc}"
 
 # DO ALL THE DIRECTORY MAGIC
 # - check for change to USER 0xE5 means DELETE file
@@ -812,7 +1238,7 @@ def check_dir_sec(unit, trk, sec, data):
                         if new['xNum'] == 0: # if first extent, use first block as base
                             pos = (b['lsec'] - (new['blocks'][0] * numRec)) * SEC_SZ
                         else: # if NOT first extent, use first block in first extent as base
-                            pos = (b['lsec'] - (dir[new['user']][filename(new['file'], False)]['data'][0] * numRec)) * SEC_SZ
+                            pos = (b['lsec'] - (dir[new['user']][filename(new['file'], False)].data[0] * numRec)) * SEC_SZ
 
                         # info(b['lsec'], new['xNum'], pos)
                         fd.seek(pos)
@@ -833,24 +1259,12 @@ def check_dir_sec(unit, trk, sec, data):
         unit_info[unit]['buffer'].clear()
 
     # UPDATE IN MEMORY DIRECTORY STRUCTURES 
-    # for i in range(EXT_SZ):
-    #     dirdata[extpos + i ] = data[ext * EXT_SZ + i]
-    dirdata[extpos: extpos + EXT_SZ] = data[ext * EXT_SZ: (ext + 1) * EXT_SZ]
-    #unit_info[unit]['dirdata'] = dirdata # not needed as lists are by reference not copied
-    unit_info[unit]['dir'] = parseDir(dirdata, 1 if unit_info[unit]['dpb']['disksize'] > 255 else 0)
+    updateDir(unit, lext, data[ext * EXT_SZ: (ext + 1) * EXT_SZ])
 
 
 def dispDirSector(unit, trk, sec, mode, type, desc):
-    i = list(unit_info).index(unit)
-    tscale = unit_info[unit]['scale']
-    win.addstr(4*i + 4, unit_info[unit]['last'] >> tscale, '.')
-    win.addstr(4*i + 5, unit_info[unit]['last'] >> tscale, ' ')
-    unit_info[unit]['last'] = trk
-    win.addstr(4*i + 4, trk >> tscale, mode, curses.A_BOLD)
-    win.addstr(4*i + 5, trk >> tscale, type, curses.A_BOLD)
-    win.addstr(4*i + 6, 0, desc)
-    win.clrtoeol()
-    win.refresh()
+    ui['track'][unit] = (trk, sec, mode, type)
+    ui['action'][unit] = desc
 
 
 def writeDirSector(unit, trk, sec, data):
@@ -858,13 +1272,13 @@ def writeDirSector(unit, trk, sec, data):
     dpb = unit_info[unit]['dpb']
     root = unit_info[unit]['file']
     # dirdata = unit_info[unit]['dirdata']
-    dir = unit_info[unit]['dir']
 
     # BOOT TRACKS
     if trk < dpb['offset']:
 
         pos = (trk * dpb['sectors'] + sec - 1) * SEC_SZ
-        info(f"WRITE BOOT: {trk}:{sec} pos= {pos}")
+        if verbose:
+            info(f"WRITE BOOT: {trk}:{sec} pos= {pos}")
         dispDirSector(unit, trk, sec, 'W', 'B', '$BOOT')
 
         if pos == 0:
@@ -879,44 +1293,39 @@ def writeDirSector(unit, trk, sec, data):
 
         return
 
-    if 'trans' in unit_info[unit]:
-        sec = unit_info[unit]['trans'].index(sec)
-    else:
-        sec = sec - 1
+    # A SECTOR OUTSIDE THE TRACK WOULD MAP TO ITS NEIGHBOUR
+    if not 0 < sec <= dpb['sectors']:
+        raise ValueError(f"SECTOR {sec} OUT OF RANGE")
 
-    numRec = dpb['blksize'] // SEC_SZ
-    sec = (trk - dpb['offset']) * dpb['sectors'] + sec
-    blk = sec // numRec
+    geo = unit_info[unit]['geo']
+    numRec = geo.recs
+    i = trk * dpb['sectors'] + sec - 1
+    sec = geo.lsec[i]
+    blk = geo.block[i]
 
     # DIRECTORY
-    if sec < ((dpb['dirsize'] * EXT_SZ) // SEC_SZ):
-        info(f"WRITE DIR : {trk}:{sec}")
+    if sec < geo.dirsecs:
+        if verbose:
+            info(f"WRITE DIR : {trk}:{sec}")
         dispDirSector(unit, trk, sec, 'W', 'D', '<DIR>')
         check_dir_sec(unit, trk, sec, data)
     else:
-        for u in range(16):
-            for f in dir[u]:
-                if blk in dir[u][f]['data']:
-                    fn = f.split('.',1)
-                    fn[0] = fn[0].strip()
-                    fn[1] = fn[1].strip()
-                    fn = '.'.join(fn)
-
-                    pos = (sec - (dir[u][f]['data'][0] * numRec)) * SEC_SZ
-                    info(f"WRITE TO FILE BLOCK: {trk}:{sec} block:{blk} in file: {fn} pos: {pos}")
-                    dispDirSector(unit, trk, sec, 'W', f"{u:X}", f"{u}: {fn}")
-
-                    fd = file_start(os.path.join(root, f'{u}', fn), 'r+b')
-                    fd.seek(pos)
-                    fd.write(data)
-                    # fd.close()
-
-                    break
-            else:
-                continue
-            break
+        ref = unit_info[unit]['blkmap'].get(blk)
+        if ref:
+            (u, fn, base) = ref
+
+            pos = (sec - (base * numRec)) * SEC_SZ
+            if verbose:
+                info(f"WRITE TO FILE BLOCK: {trk}:{sec} block:{blk} in file: {fn} pos: {pos}")
+            dispDirSector(unit, trk, sec, 'W', f"{u:X}", f"{u}: {fn}")
+
+            fd = file_start(os.path.join(root, f'{u}', fn), 'r+b')
+            fd.seek(pos)
+            fd.write(data)
+            # fd.close()
         else:
-            info(f"WRITE TO EMPTY BLOCK: {trk}:{sec} block:{blk}")
+            if verbose:
+                info(f"WRITE TO EMPTY BLOCK: {trk}:{sec} block:{blk}")
             dispDirSector(unit, trk, sec, 'W', '#', '<BUFFERING>')
             unit_info[unit]['buffer'].append({ 'lsec': sec, 'blk': blk, 'data': data })
     return
@@ -932,19 +1341,20 @@ def read_sector(unit, trk, sec):
 
 def readFileSector(unit, trk, sec):
 
-    info(f"IMAGE READ: {unit}:{trk}:{sec} {unit_info[unit]['file']}")
+    if verbose:
+        info(f"IMAGE READ: {unit}:{trk}:{sec} {unit_info[unit]['file']}")
     dispFileSector(unit, trk, sec, 'R')
 
-    dpb = unit_info[unit]['dpb']
+    with wb_lock:
+        mm = image_mapping(unit)
+        pos = (trk * unit_info[unit]['dpb']['sectors'] + sec - 1) * SEC_SZ
 
-    fd = open(unit_info[unit]['file'], 'rb')
+        if writeback:
+            data = unit_info[unit]['dirty'].get(pos)
+            if data != None:
+                return data
 
-    pos = (trk * dpb['sectors'] + sec - 1) * SEC_SZ
-    fd.seek(pos)
-    data = fd.read(SEC_SZ)
-    
-    fd.close()
-    return data
+        return mm[pos: pos + SEC_SZ]
 
 
 def readDirSector(unit, trk, sec):
@@ -954,12 +1364,12 @@ def readDirSector(unit, trk, sec):
     root = unit_info[unit]['file']
     boot = unit_info[unit]['boot']
     dirdata = unit_info[unit]['dirdata']
-    dir = unit_info[unit]['dir']
     dpb = unit_info[unit]['dpb']
 
     # BOOT TRACKS
     if trk < dpb['offset']:
-        info(f"READ BOOT: {trk}:{sec}")
+        if verbose:
+            info(f"READ BOOT: {trk}:{sec}")
         dispDirSector(unit, trk, sec, 'R', 'B', '$BOOT')
 
         if boot:
@@ -974,18 +1384,20 @@ def readDirSector(unit, trk, sec):
 
         return data
 
-    if 'trans' in unit_info[unit]:
-        sec = unit_info[unit]['trans'].index(sec)
-    else:
-        sec = sec - 1
+    # A SECTOR OUTSIDE THE TRACK WOULD MAP TO ITS NEIGHBOUR
+    if not 0 < sec <= dpb['sectors']:
+        raise ValueError(f"SECTOR {sec} OUT OF RANGE")
 
-    numRec = dpb['blksize'] // SEC_SZ
-    sec = (trk - dpb['offset']) * dpb['sectors'] + sec
-    blk = sec // numRec
+    geo = unit_info[unit]['geo']
+    numRec = geo.recs
+    i = trk * dpb['sectors'] + sec - 1
+    sec = geo.lsec[i]
+    blk = geo.block[i]
 
     # DIRECTORY
-    if sec < ((dpb['dirsize'] * EXT_SZ) // SEC_SZ):
-        info(f"READ DIR : {trk}:{sec}")
+    if sec < geo.dirsecs:
+        if verbose:
+            info(f"READ DIR : {trk}:{sec}")
         dispDirSector(unit, trk, sec, 'R', 'D', '<DIR>')
 
         file_end()
@@ -995,50 +1407,44 @@ def readDirSector(unit, trk, sec):
 
     # DISK DATA
     else:
-        for u in range(16):
-            for f in dir[u]:
-                if blk in dir[u][f]['data']:
-                    fn = f.split('.',1)
-                    fn[0] = fn[0].strip()
-                    fn[1] = fn[1].strip()
-                    fn = '.'.join(fn)
-
-                    pos = (sec - (dir[u][f]['data'][0] * numRec)) * SEC_SZ
-                    info(f"READ FILE BLOCK: {trk}:{sec} block:{blk} in file: {fn} pos: {pos}")
-                    dispDirSector(unit, trk, sec, 'R', f"{u:X}", f"{u}: {fn}")
+        ref = unit_info[unit]['blkmap'].get(blk)
+        if ref:
+            (u, fn, base) = ref
 
-                    fd = file_start(os.path.join(root, f'{u}', fn), 'rb')
+            pos = (sec - (base * numRec)) * SEC_SZ
+            if verbose:
+                info(f"READ FILE BLOCK: {trk}:{sec} block:{blk} in file: {fn} pos: {pos}")
+            dispDirSector(unit, trk, sec, 'R', f"{u:X}", f"{u}: {fn}")
 
-                    fd.seek(pos)
-                    data = fd.read(SEC_SZ)
+            fd = file_start(os.path.join(root, f'{u}', fn), 'rb')
 
-                    if len(data) < SEC_SZ:
-                        warning(f"SHORT FILE: {os.path.join(root, f'{u}', fn)} len={len(data)} - PADDED WITH EOF [0x1A]")
-                        tmp = bytearray(eof_sec)
-                        tmp[0:len(data)] = data[0:]
-                        data = tmp
+            fd.seek(pos)
+            data = fd.read(SEC_SZ)
 
-                    # fd.close()
+            if len(data) < SEC_SZ:
+                warning(f"SHORT FILE: {os.path.join(root, f'{u}', fn)} len={len(data)} - PADDED WITH EOF [0x1A]")
+                tmp = bytearray(eof_sec)
+                tmp[0:len(data)] = data[0:]
+                data = tmp
 
-                    break
-            else:
-                continue
-            break
+            # fd.close()
         else:
             data = bytearray(empty_sec)
 
     return data
 
 
-def disk_io(addr):
-    dma_get = sess.get(f'{hosturl}/dma?m={addr:04X}&n=7')
-    mem = dma_get.content
-    return disk_io_action(mem, addr)
+async def disk_io(b, addr):
+    (status, mem) = await iosrv.get(b['dma'], f'/dma?m={addr:04X}&n=7')
+    return await disk_io_action(b, mem, addr)
 
 
-def disk_io_action(mem, addr):
+async def disk_io_action(b, mem, addr):
 
-    unit = mem[0] & 0x0F
+    start = time.perf_counter()
+
+    dma = b['dma']
+    unit = (b['index'] << 4) | (mem[0] & 0x0F)
     cmd = mem[0] >> 4
     res = mem[1]
     fmt = mem[2]
@@ -1050,54 +1456,106 @@ def disk_io_action(mem, addr):
 
     if unit in list(unit_info):
 
-        i = list(unit_info).index(unit)
-        win.addstr(4*i + 3, 35, f"{cmd_str[cmd]:6} TRK:{(track+1):3} SEC:{sector:3} DMA: {dma_addr:04X}h")
-        win.refresh()
+        dispCommand(unit, cmd, track, sector, dma_addr)
+
         if unit_info[unit]['type'] == 'LOCAL':
 
             mode = 'W' if cmd == 1 else 'R' if cmd == 2 else '?'
             dispFileSector(unit, track, sector,  mode)
+            trace_record(unit, cmd, track, sector, 0, start)
             
             return 0
         
-        if cmd == 1:
+        try:
+            if cmd == 1:
 
-            sec_get = sess.get(f'{hosturl}/dma?m={dma_addr:04X}&n={SEC_SZ:02X}')
-            blksec = sec_get.content
+                (status, blksec) = await iosrv.get(dma, f'/dma?m={dma_addr:04X}&n={SEC_SZ:02X}')
 
-            write_sector(unit, track, sector, blksec)
+                write_sector(unit, track, sector, blksec)
 
-            disk_res = bytes.fromhex('01')
-        elif cmd == 2:
+                disk_res = bytes.fromhex('01')
+            elif cmd == 2:
 
-            blksec = read_sector(unit, track, sector)
+                blksec = read_sector(unit, track, sector)
 
-            sec_put = sess.put(f'{hosturl}/dma?m={dma_addr:04X}&n={SEC_SZ:02X}', data=blksec)
-            
-            disk_res = bytes.fromhex('01')
-        else: 
-            disk_res = bytes.fromhex('A1')
+                await iosrv.put(dma, f'/dma?m={dma_addr:04X}&n={SEC_SZ:02X}', blksec)
+                
+                disk_res = bytes.fromhex('01')
+            else: 
+                disk_res = bytes.fromhex('A1')
+
+            dispResult(unit, disk_res[0])
+            (status, text) = await iosrv.put(dma, f'/dma?m={(addr + 1):04X}', disk_res)
+            # info(status, text)
+        except Exception as e:
+            trace_record(unit, cmd, track, sector, 0xFF, start)
+            error(f"FIF ERROR: {unit}:{track}:{sector} {cmd_str[cmd] if cmd < len(cmd_str) else cmd} {e}")
+            trace_dump('EXCEPTION')
+            raise
 
-        win.addstr(4*i + 3, 69, f"RES: {disk_res[0]:02X}")
-        win.refresh()
-        dma_put = sess.put(f'{hosturl}/dma?m={(addr + 1):04X}', data=disk_res)
-        # info(dma_put.status_code, dma_put.text)
+        trace_record(unit, cmd, track, sector, disk_res[0], start)
+        if disk_res[0] != 0x01:
+            trace_dump(f'RESULT {disk_res[0]:02X}')
 
         return 1
 
     return 0
 
+
+def trace_record(unit, cmd, track, sector, res, start):
+
+    global trace_count
+
+    elapsed = time.perf_counter() - start
+    TRACE_REC.pack_into(trace_buf, (trace_count % TRACE_LEN) * TRACE_REC.size,
+                        time.time() - elapsed, unit, cmd, track, sector, res, elapsed * 1000)
+    trace_count += 1
+
+
+# DUMP THE RING BUFFER OLDEST FIRST - DECODED TO THE LOG AND RAW TO trace.bin
+def trace_dump(reason):
+
+    count = min(trace_count, TRACE_LEN)
+    first = trace_count - count
+
+    warning(f"TRACE DUMP: {reason} {count} records")
+
+    with open('trace.bin', 'wb') as fp:
+        for n in range(first, trace_count):
+            pos = (n % TRACE_LEN) * TRACE_REC.size
+            rec = trace_buf[pos: pos + TRACE_REC.size]
+            fp.write(rec)
+
+            (t, unit, cmd, track, sector, res, ms) = TRACE_REC.unpack(rec)
+            stamp = time.strftime('%H:%M:%S', time.localtime(t)) + f'.{int(t * 1000000) % 1000000:06}'
+            warning(f"TRACE: {stamp} {unit >> 4:X}.{unit & 0x0F:X}:{track:3}:{sector:3} {cmd_str[cmd] if cmd < len(cmd_str) else cmd:6} RES:{res:02X} {ms:8.3f}ms")
+
+
+def dispCommand(unit, cmd, track, sector, dma_addr):
+    ui['cmd'][unit] = (cmd, track, sector, dma_addr)
+
+def dispResult(unit, res):
+    ui['res'][unit] = res
+
 if __name__ == "__main__":
     try:
         logging.basicConfig(filename="trace.log", filemode="w", level=logging.INFO)
-        curses.wrapper(main)
+        parse_args()
+        if headless:
+            daemon()
+        else:
+            curses.wrapper(main)
         # main(None)
     except KeyboardInterrupt:
         logging.root.setLevel(logging.INFO)
         debug("KEY INT")
         file_end()
-        sess.close()
-        sys_get = requests.delete(f'{hosturl}/io?p={FIF_PORT:02X}')
-        if sys_get.status_code == 200:
-            info(f'De-registered on {sys_get.text}')
+        image_close_all()
+        for b in boards:
+            try:
+                sys_get = requests.delete(f"{b['host']}/io?p={FIF_PORT:02X}")
+                if sys_get.status_code == 200:
+                    info(f'De-registered on {sys_get.text}')
+            except requests.exceptions.RequestException as e:
+                error(f"FAILED to de-register {b['host']}: {e}")
         pass
\ No newline at end of file
@@ -10,7 +10,8 @@
 #   dependencies:
 #       python3
 #       requests (module)           - to install, use: pip install requests
-#       simple_http_server (module) - to install, use: pip install simple_http_server
+#       iosrv.py                    - the IO callback endpoint and DMA client, alongside this file
+#       geometry.py                 - the disk formats, alongside this file
 #
 #   TODO:
 #       - add more error detection and return more error codes
@@ -26,9 +27,9 @@ import requests
 import sys
 import os
 import socket
-from simple_http_server import route, server, Response, ModelDict, logger
-
-logger.set_level("ERROR")
+import mmap
+import iosrv
+import geometry
 
 srv = os.path.splitext(os.path.basename(sys.argv[0]))[0]
 
@@ -43,43 +44,80 @@ disks = { 'A': 'cpm22b01.dsk', 'B': 'comms.dsk', 'C': 'dazzler.dsk', 'D': 'ZorkI
 disk_to_unit = { 'A': 1, 'B': 2, 'C': 4, 'D': 8, 'I': 15 }
 sel_units = [ ]
 unit_file = { }
+unit_image = { }
+
+dma = iosrv.client(hosturl)
 
 def main():
     print('DISKS:')
     for d in disks:
         sel_units.append(disk_to_unit[d])
         unit_file[disk_to_unit[d.upper()]] = disks[d]
+        image_open(disk_to_unit[d.upper()])
         print(f'\tDSK:{d.upper()}: = {disks[d]}')
 
-    sys_get = requests.patch(f'{hosturl}/io?p=-{FIF_PORT:02X}', data=_srvurl)
+    sys_get = requests.patch(f'{hosturl}/io?p=-{FIF_PORT:02X}&b=0x0F', data=_srvurl)
     if sys_get.status_code == 200:
         print(f'Listening and registered on Port {FIF_PORT:02X}h to {sys_get.text}')
 
     ## DONT RUN THIS IN A VM OR THE HOST CAN'T BE SEEN
-    server.start(host="", port=SRV_PORT)
-
-@route(f'/{SRV_PATH}', method="PUT")
-def io_out(p, m=ModelDict()):
-    port = int(p, 16)
-    #BODY is a little hard to get as it ends up as the first KEY in the DICT m
-    data = int(next(iter(m)), 16) 
+    iosrv.run(f'/{SRV_PATH}', io_out, SRV_PORT)
+
+# MAP EACH IMAGE FILE INTO MEMORY ONCE, SECTORS ARE THEN SERVED DIRECTLY FROM THE MAPPING
+def image_open(unit):
+    fd = open(unit_file[unit], 'r+b')
+    unit_image[unit] = (fd, mmap.mmap(fd.fileno(), 0))
+
+def image_close_all():
+    for unit in list(unit_image):
+        fd, mm = unit_image.pop(unit)
+        mm.flush()
+        mm.close()
+        fd.close()
+
+async def io_out(method, port, body, peer):
+    if method == 'POST':
+        return await io_out_post(port, body)
+    return await io_out_put(port, body)
+
+async def io_out_put(port, body):
+    #BODY is the data byte in hex, sent form encoded
+    data = int(body.split(b'=')[0], 16) 
     # print(f'{port:02X} {data:02X}')
     if port == FIF_PORT:
-        t = fif_out(data)
+        t = await fif_out(data)
+
+        if t == 1:
+            return 201
+    return 200
+
+async def io_out_post(port, body):
+    data = bytearray(body) 
+    if port == FIF_PORT:
+        t = await fif_with_dma(data)
 
         if t == 1:
-            return Response(status_code=201)
-    return #normal 200 response 
+            return 201
+    return 200
 
 fdstate = 0
 descno = 0
 fdaddr = [0] * 16
 
-def fif_out(data):
+async def fif_with_dma(mem):
+
+    global descno
+
+    # POST BODY IS THE 7 BYTE DESCRIPTOR FOLLOWED BY ITS ADDRESS AND NUMBER
+    descno = mem[9]
+    fdaddr[descno] = (mem[8] << 8) + mem[7]
+
+    return await disk_io_action(mem, fdaddr[descno])
+
+async def fif_out(data):
 
     global descno
     global fdstate
-    global fdaddr
 
     res = 0
 
@@ -87,7 +125,7 @@ def fif_out(data):
         op = data & 0xF0
         if op == 0x00:
             descno = data & 0x0F
-            res = disk_io(fdaddr[descno])
+            res = await disk_io(fdaddr[descno])
         elif op == 0x10:
             descno = data & 0x0F
             fdstate += 1
@@ -106,11 +144,13 @@ def fif_out(data):
 cmd_str = [ "", "WRITE", "READ", "FORMAT", "VERIFY" ]
 
 SEC_SZ = 128
-SPT8 = 26
+SPT8 = geometry.FD8.dpb['sectors']
 
-def disk_io(addr):
-    dma_get = requests.get(f'{hosturl}/dma?m={addr:04X}&n=7')
-    mem = dma_get.content
+async def disk_io(addr):
+    (status, mem) = await iosrv.get(dma, f'/dma?m={addr:04X}&n=7')
+    return await disk_io_action(mem, addr)
+
+async def disk_io_action(mem, addr):
 
     unit = mem[0] & 0x0F
     cmd = mem[0] >> 4
@@ -124,35 +164,30 @@ def disk_io(addr):
 
     if unit in sel_units:
 
-        if cmd == 1:
-            fd = open(unit_file[unit], 'r+b')
-
-            pos = (track * SPT8 + sector - 1) * SEC_SZ
+        mm = unit_image[unit][1]
+        pos = (track * SPT8 + sector - 1) * SEC_SZ
 
-            sec_get = requests.get(f'{hosturl}/dma?m={dma_addr:04X}&n={SEC_SZ:02X}')
-            blksec = sec_get.content
+        # A TRACK OR SECTOR BEYOND THE IMAGE IS ANSWERED WITH THE ERROR STATUS, NOT SLICED
+        if cmd in (1, 2) and (sector < 1 or pos + SEC_SZ > len(mm)):
+            print(f'{cmd_str[cmd]} BEYOND END: {unit}:{track}:{sector}')
+            disk_res = bytes.fromhex('A1')
+        elif cmd == 1:
+            (status, blksec) = await iosrv.get(dma, f'/dma?m={dma_addr:04X}&n={SEC_SZ:02X}')
 
-            fd.seek(pos)
-            fd.write(blksec)
-            fd.close()
+            mm[pos: pos + len(blksec)] = blksec
 
             disk_res = bytes.fromhex('01')
         elif cmd == 2:
-            fd = open(unit_file[unit], 'rb')
-
-            pos = (track * SPT8 + sector - 1) * SEC_SZ
-            fd.seek(pos)
-            block = fd.read(SEC_SZ)
+            block = mm[pos: pos + SEC_SZ]
 
-            sec_put = requests.put(f'{hosturl}/dma?m={dma_addr:04X}&n={SEC_SZ:02X}', data=block)
+            await iosrv.put(dma, f'/dma?m={dma_addr:04X}&n={SEC_SZ:02X}', block)
             
-            fd.close()
             disk_res = bytes.fromhex('01')
         else: 
             disk_res = bytes.fromhex('A1')
 
-        dma_put = requests.put(f'{hosturl}/dma?m={(addr + 1):04X}', data=disk_res)
-        # print(dma_put.status_code, dma_put.text)
+        (status, text) = await iosrv.put(dma, f'/dma?m={(addr + 1):04X}', disk_res)
+        # print(status, text)
 
         return 1
 
@@ -164,6 +199,7 @@ if __name__ == "__main__":
     except KeyboardInterrupt:
         # do nothing here
         print("KEY INT")
+        image_close_all()
         sys_get = requests.delete(f'{hosturl}/io?p={FIF_PORT:02X}')
         if sys_get.status_code == 200:
             print(f'De-registered on {sys_get.text}')
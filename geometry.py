@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+##
+#   geometry.py
+#
+#   Copyright (C) David McNaughton 2023-present
+#
+#   the CP/M (2.2) disk formats used by pack.py, unpack.py, fifsrv.py and fifDirSrv.py
+#   with their sector translation tables, built once per format
+#
+#   a format is its DPB and skew table, to add one (eg. for another IMSAI or Cromemco
+#   drive) register it with a name and the image file extension it is packed to:
+#
+#       geometry.register(name, dpb, trans=[ skew table ], ext='.ext')
+#
+#   dependencies:
+#       python3
+#
+#   history:
+#        17-OCT-2026     1.0     Initial release
+##
+
+from array import array
+
+EXT_SZ = 32
+SEC_SZ = 128
+
+trans8 = [ 1,7,13,19,25,5,11,17,23,3,9,15,21,2,8,14,20,26,6,12,18,24,4,10,16,22 ]
+
+dpb8 = {
+    'sectors': 26,
+    'blksize': 1024,
+    'dirsize': 64,
+    'disksize': 243,
+    'offset': 2,
+    'tracks': 77
+}
+
+dpbHD = {
+    'sectors': 128,
+    'blksize': 2048,
+    'dirsize': 1024,
+    'disksize': 2040,
+    'offset': 0,
+    'tracks': 255
+}
+
+
+class Geometry:
+    """The translation tables of one disk format
+
+    a physical sector is indexed trk * sectors + sec - 1 (sec as sent by the BIOS, from 1)
+    and a logical sector is counted from the first sector of the directory
+
+    - dpb : the disk parameter block
+    - trans : logical -> physical sector within a track (from 1), the skew table
+    - skew : physical sector (from 1) -> logical sector within a track, the inverse of trans
+    - lsec : physical sector -> logical sector, -1 on the boot tracks
+    - block : physical sector -> block, -1 on the boot tracks
+    - pos : logical sector -> byte offset in the image file
+    """
+    __slots__ = ('name', 'dpb', 'trans', 'skew', 'lsec', 'block', 'pos', 'recs', 'dirsecs', 'bootsize', 'size')
+
+    def __init__(self, name, dpb, trans=None):
+
+        spt = dpb['sectors']
+        boot = dpb['offset'] * spt
+
+        self.name = name
+        self.dpb = dpb
+        self.trans = trans if trans else list(range(1, spt + 1))
+        self.skew = [ -1 ] * (spt + 1)
+        for (s, p) in enumerate(self.trans):
+            self.skew[p] = s
+
+        self.recs = dpb['blksize'] // SEC_SZ
+        self.dirsecs = dpb['dirsize'] * EXT_SZ // SEC_SZ
+        self.bootsize = boot * SEC_SZ
+        self.size = dpb['tracks'] * spt * SEC_SZ
+
+        self.lsec = array('l', [ -1 ]) * (dpb['tracks'] * spt)
+        self.block = array('l', [ -1 ]) * (dpb['tracks'] * spt)
+        self.pos = array('L', [ 0 ]) * (dpb['tracks'] * spt - boot)
+
+        for i in range(boot, dpb['tracks'] * spt):
+            l = (i - boot) - (i % spt) + self.skew[i % spt + 1]
+            self.lsec[i] = l
+            self.block[i] = l // self.recs
+            self.pos[l] = i * SEC_SZ
+
+    # THE (offset, length) IN THE IMAGE OF EACH RUN OF CONTIGUOUS SECTORS HOLDING THE FIRST
+    # recs RECORDS OF THE blocks (0 POINTERS ARE SKIPPED) - A WHOLE BLOCK WHEN UNSKEWED
+    def runs(self, blocks, recs):
+
+        numRec = self.recs
+
+        for b in blocks:
+
+            if b > 0:
+                r = numRec if recs > numRec else recs
+                recs -= r
+
+                s = 0
+                while s < r:
+                    pos = self.pos[b * numRec + s]
+                    n = 1
+                    while s + n < r and self.pos[b * numRec + s + n] == pos + n * SEC_SZ:
+                        n += 1
+
+                    yield (pos, n * SEC_SZ)
+                    s += n
+
+
+FORMATS = { }
+EXTS = { }
+
+def register(name, dpb, trans=None, ext=None):
+    FORMATS[name] = Geometry(name, dpb, trans)
+    if ext:
+        EXTS[ext] = name
+    return FORMATS[name]
+
+def for_ext(ext):
+    return FORMATS.get(EXTS.get(ext))
+
+
+FD8 = register('fd8', dpb8, trans8, '.dsk')
+HD = register('hd', dpbHD, ext='.hdd')
@@ -24,11 +24,16 @@
 #        07-JUL-2021     1.0     Initial release
 ##
 
-import requests
 import json
 import sys
 import os
-import websocket
+import re
+import time
+import hashlib
+import shlex
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 cmd = os.path.split(sys.argv[0])[1]
 
@@ -37,63 +42,274 @@ if cmd == 'imsai':
 elif cmd == 'cromemco':
     baseurl = 'http://cromemco'
 
-sys_get = requests.get(baseurl + '/system')
-task_get = requests.get(baseurl + '/tasks')
-dsk_get = requests.get(baseurl + '/disks?x')
-lib_get = requests.get(baseurl + '/library')
-man_get = requests.get(baseurl + '/manual')
-conf_get = requests.get(baseurl + '/conf')
+endpoints = {
+    'sys': '/system',
+    'tasks': '/tasks',
+    'dsk': '/disks?x',
+    'lib': '/library',
+    'man': '/manual',
+    'conf': '/conf'
+}
+
+# SECONDS A LISTING IS TAKEN FROM THE CACHE BEFORE IT IS CHECKED WITH THE BOARD AGAIN
+ttl = {
+    'sys': 60,
+    'tasks': 5,
+    'dsk': 10,
+    'lib': 300,
+    'man': 3600,
+    'conf': 300
+}
+
+CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'imsai')
+
+_session = None
+_cpa_ws = None
+_fetched = { }
+_cache = None
+_init = threading.Lock()
+use_cache = True
+failures = 0
+
+
+# A COMMAND THAT FAILS SAYS WHY AND imsai THEN EXITS 1, SO A FLEET RUN OR A CALLING SCRIPT SEES IT
+def fail(msg):
+    global failures
+    failures += 1
+    print(msg, flush=True)
+
+
+def report(ok, msg):
+    if ok:
+        print(msg, flush=True)
+    else:
+        fail(msg)
+
+
+# ONE POOLED SESSION FOR EVERY REQUEST, requests IS ONLY IMPORTED BY THE COMMANDS THAT TALK TO THE BOARD
+# THE SESSION AND THE CACHE ARE FIRST ASKED FOR FROM THE THREADS OF fetch(), SO ARE MADE UNDER _init
+def session():
+    global _session
+    with _init:
+        if _session == None:
+            import requests
+            _session = requests.Session()
+    return _session
+
+
+# THE LISTINGS OF EACH BOARD ARE CACHED ON DISK, ONE FILE PER baseurl
+def cache_name():
+    return os.path.join(CACHE_DIR, re.sub('[^A-Za-z0-9.-]', '_', baseurl) + '.json')
+
+
+def cache():
+    global _cache
+    with _init:
+        if _cache == None:
+            try:
+                with open(cache_name()) as f:
+                    _cache = json.load(f)
+            except (OSError, ValueError):
+                _cache = { }
+    return _cache
+
+
+def cache_save():
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp = f'{cache_name()}.{os.getpid()}'
+        with open(tmp, 'w') as f:
+            json.dump(cache(), f)
+        os.replace(tmp, cache_name())
+    except OSError:
+        pass
+
+
+# AFTER A CHANGE IS MADE ON THE BOARD THE LISTINGS IT AFFECTS (DEFAULT ALL) ARE FETCHED AGAIN
+def invalidate(*names):
+    for n in names or list(endpoints):
+        cache().pop(n, None)
+        _fetched.pop(n, None)
+    cache_save()
+
+
+# GET A LISTING, FROM THE CACHE IF NOT OLDER THAN ITS ttl, OTHERWISE CONDITIONALLY WHERE THE BOARD
+# GAVE AN ETag OR Last-Modified (AN UNCHANGED LISTING IS THEN ANSWERED 304, WITH NO BODY)
+# confirm ALWAYS ASKS THE BOARD, FOR A COMMAND ABOUT TO CHANGE IT
+def get_listing(n, confirm=False):
+    entry = cache().get(n) if use_cache else None
+    now = time.time()
+
+    if entry and not confirm and now - entry['time'] < ttl[n]:
+        return (entry['data'], False)
+
+    headers = { }
+    if entry and entry.get('etag'):
+        headers['If-None-Match'] = entry['etag']
+    if entry and entry.get('modified'):
+        headers['If-Modified-Since'] = entry['modified']
+
+    res = session().get(baseurl + endpoints[n], headers=headers)
+    if res.status_code == 304 and entry:
+        entry['time'] = now
+        return (entry['data'], True)
+
+    data = res.json()
+    cache()[n] = {
+        'time': now,
+        'etag': res.headers.get('ETag'),
+        'modified': res.headers.get('Last-Modified'),
+        'data': data
+    }
+    return (data, True)
+
+
+# FETCH ONLY THE LISTINGS A COMMAND USES, THOSE NOT ALREADY FETCHED OR CACHED ARE REQUESTED CONCURRENTLY
+# A COMMAND THAT DELETES, LOADS OR REPLACES ON THE BOARD DECIDES WITH confirm=True, NOT FROM THE CACHE
+def fetch(*names, confirm=False):
+    todo = [ n for n in names if confirm or n not in _fetched ]
+
+    if len(todo) == 1:
+        got = [ get_listing(todo[0], confirm) ]
+    elif len(todo) > 1:
+        with ThreadPoolExecutor(len(todo)) as pool:
+            got = list(pool.map(lambda n: get_listing(n, confirm), todo))
+    else:
+        got = [ ]
+
+    for (n, (data, fresh)) in zip(todo, got):
+        _fetched[n] = data
+    if any(fresh for (data, fresh) in got):
+        cache_save()
+
+    if len(names) == 1:
+        return _fetched[names[0]]
+    return [ _fetched[n] for n in names ]
+
+
+CHUNK = 64 * 1024
+
+
+# SHOW A TRANSFER AS IT GOES, ONLY TO A TERMINAL
+def progress(label, done, total, start):
+    if label and sys.stdout.isatty():
+        rate = done / 1024 / max(time.perf_counter() - start, 1e-6)
+        print(f'\r{label} {done}/{total or "?"} bytes {rate:.1f} KB/s ', end='', flush=True)
+        if done == total:
+            print()
+
+
+class Upload:
+    """A local file sent in chunks as the request body, its length is known so it goes with a Content-Length"""
+
+    def __init__(self, name, label):
+        self.file = open(name, 'rb')
+        self.size = os.fstat(self.file.fileno()).st_size
+        self.sent = 0
+        self.label = label
+        self.start = time.perf_counter()
+
+    def __len__(self):
+        return self.size
+
+    def read(self, n=-1):
+        data = self.file.read(n)
+        self.sent += len(data)
+        progress(self.label, self.sent, self.size, self.start)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+# PUT A LOCAL FILE, THEN CHECK THE {'size', 'filename'} THE BOARD ANSWERS WITH - RETURNS (success, message)
+def upload(url, name, label, quiet=False):
+    body = Upload(name, None if quiet else label)
+    try:
+        res = session().put(url, data=body)
+    finally:
+        body.close()
+    secs = time.perf_counter() - body.start
+
+    if res.status_code != 200:
+        return (False, f'{label} failed - server error ({res.status_code})')
+    got = res.json()
+    if got['size'] != body.size:
+        return (False, f"{label} failed - {got['size']} of {body.size} bytes received by {got['filename']}")
+    return (True, f"{label} success - {got['size']} bytes uploaded to {got['filename']} ({got['size'] / 1024 / secs:.1f} KB/s)")
+
 
-d_sys = sys_get.json()
-d_tasks = task_get.json()
-d_dsk = dsk_get.json()
-a_lib = lib_get.json()
-a_man = man_get.json()
-a_conf = conf_get.json()
+# GET A FILE STREAMED TO A TEMPORARY FILE, RENAMED INTO PLACE ONCE ALL OF IT HAS ARRIVED
+# RETURNS (success, message), success IS None IF THE BOARD DOES NOT HAVE IT
+def download(url, name, label, quiet=False):
+    start = time.perf_counter()
+    with session().get(url, stream=True) as res:
+        if res.status_code != 200:
+            return (None, f'{label} failed - server error ({res.status_code})')
+        total = int(res.headers.get('Content-Length', 0))
+        done = 0
+        tmp = name + '.part'
+        try:
+            with open(tmp, 'wb') as files:
+                for chunk in res.iter_content(CHUNK):
+                    files.write(chunk)
+                    done += len(chunk)
+                    progress(None if quiet else label, done, total, start)
+            if total and done != total:
+                os.remove(tmp)
+                return (False, f'{label} failed - {done} of {total} bytes received')
+            os.replace(tmp, name)
+        except:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+    return (True, f'{label} success - {done} bytes downloaded to {name} ({done / 1024 / (time.perf_counter() - start):.1f} KB/s)')
 
 
 def sys_f(args):
 
     if len(args) >= 1:
         sect = args[0]
+        if sect.startswith('--'):
+            d_sys = { }
+        elif sect == 'tasks':
+            (d_sys, d_tasks) = fetch('sys', 'tasks')
+        else:
+            d_sys = fetch('sys')
+
         if sect in d_sys.keys():
             print(json.dumps(d_sys[sect], indent=4))
         elif sect == 'tasks':
             print(json.dumps(d_tasks, indent=4))
         elif sect == '--reboot':
-            reboot_get = requests.delete(baseurl + '/system')
+            reboot_get = session().delete(baseurl + '/system')
+            invalidate()
             if reboot_get.status_code == 205:
                 print('SYS: REBOOT underway')
             else:
-                print('SYS: REBOOT failed')
+                fail('SYS: REBOOT failed')
         elif sect == '--update' and len(args) >= 2:
             bin_name = args[1]
             if not bin_name.endswith('.bin'):
-                print("SYS: UPDATE only try to flash a binary")
+                fail("SYS: UPDATE only try to flash a binary")
             else:
                 if not os.path.exists(bin_name):
-                    print(f'SYS: UPDATE {bin_name} does not exist ?')
+                    fail(f'SYS: UPDATE {bin_name} does not exist ?')
                 else:
                     print(f"SYS: UPDATE {bin_name}")
-                    files = open(bin_name, 'rb')
-                    bin_file = requests.put(baseurl + '/flash?' + bin_name,
-                                            data=files)
-                    if bin_file.status_code == 200:
-                        fmt = 'SYS: UPDATE success - {} bytes uploaded to {}'
-                        res = bin_file.json()
-                        print(fmt.format(res['size'], res['filename']))
-                    else:
-                        fmt = 'SYS: UPDATE failed - server error ({})'
-                        print(fmt.format(bin_file.status_code))
+                    report(*upload(baseurl + '/flash?' + bin_name, bin_name, 'SYS: UPDATE'))
+                    invalidate()
         else:
-            print('SYS: ' + sect + ' ?')
+            fail('SYS: ' + sect + ' ?')
 
     else:
+        (d_sys, d_tasks) = fetch('sys', 'tasks')
         print(json.dumps(d_sys, indent=4))
         print(json.dumps(d_tasks, indent=4))
 
 
 def dsk_f(args):
+    d_dsk = fetch('dsk')
     # print(json.dumps(d_dsk, indent=4))
     for d in d_dsk:
         fmt = '\t{}:DSK: = {}'
@@ -102,6 +318,10 @@ def dsk_f(args):
 
 def xdsk_f(disk, args):
     disk = disk.upper()
+    if len(args) and args[0] == '--load':
+        (d_dsk, a_lib) = fetch('dsk', 'lib', confirm=True)
+    else:
+        d_dsk = fetch('dsk', confirm=len(args) > 0)
     if len(args) == 0:
         fmt = '\t{} = {}'
         print(fmt.format(disk, d_dsk[disk[0]] or '<empty>'))
@@ -110,42 +330,174 @@ def xdsk_f(disk, args):
         if action == '--eject':
             print('Eject ' + disk)
             if disk[0] not in ['A', 'B', 'C', 'D']:
-                print('ERROR: ' + disk + ' not a floppy disk drive')
+                fail('ERROR: ' + disk + ' not a floppy disk drive')
             elif not d_dsk[disk[0]]:
-                print('ERROR: ' + disk + ' already empty')
+                fail('ERROR: ' + disk + ' already empty')
             else:
-                dsk_get = requests.delete(baseurl + '/disks?' + disk)
+                dsk_get = session().delete(baseurl + '/disks?' + disk)
+                invalidate('dsk')
                 if dsk_get.status_code == 200:
                     print('OK Ejected')
                 else:
-                    print('Failed to Eject')
+                    fail('Failed to Eject')
 
         elif action == '--load':
             image = args[1]
             print('Load ' + disk + ' = ' + image)
 
             if disk[0] not in ['A', 'B', 'C', 'D']:
-                print('ERROR: ' + disk + ' not a floppy disk drive')
+                fail('ERROR: ' + disk + ' not a floppy disk drive')
             elif d_dsk[disk[0]]:
-                print('ERROR: ' + disk + ' not empty')
+                fail('ERROR: ' + disk + ' not empty')
             elif not image.endswith('.dsk'):
-                print('ERROR: ' + image + ' not a floppy disk image')
+                fail('ERROR: ' + image + ' not a floppy disk image')
             elif not image in a_lib:
-                print('ERROR: ' + image + ' not in library')
+                fail('ERROR: ' + image + ' not in library')
             elif image in d_dsk.values():
-                print('ERROR: ' + image + ' already loaded')
+                fail('ERROR: ' + image + ' already loaded')
             else:
-                dsk_get = requests.put(baseurl + '/disks?' + disk, data=image)
+                dsk_get = session().put(baseurl + '/disks?' + disk, data=image)
+                invalidate('dsk')
 
                 if dsk_get.status_code == 200:
                     print('OK Loaded')
                 else:
-                    print('Failed to load')
+                    fail('Failed to load')
         else:
-            print(disk + ' ' + action + ' ?')
+            fail(disk + ' ' + action + ' ?')
+
+
+SYNC_MANIFEST = '.imsai-sync.json'
+SYNC_JOBS = 3
+
+
+def file_hash(name):
+    h = hashlib.sha256()
+    with open(name, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+# THE HASH OF THE BOARD'S COPY OF A LIBRARY IMAGE, STREAMED NOT SAVED - None IF IT CANNOT BE THE SAME
+# AS A LOCAL FILE OF size BYTES (THE BOARD GAVE A DIFFERENT Content-Length, OR NOT THE IMAGE)
+def board_hash(n, size):
+    h = hashlib.sha256()
+    with session().get(baseurl + '/imsai/disks/' + n, stream=True) as res:
+        if res.status_code != 200 or int(res.headers.get('Content-Length', size)) != size:
+            return None
+        for chunk in res.iter_content(CHUNK):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+# SYNC LIB: WITH A LOCAL DIRECTORY OF MASTER COPIES, USING THE HASHES OF WHAT WAS LAST PUSHED OR PULLED
+#   - an image only in the directory, or changed since the last sync, is pushed (replacing the board's)
+#   - an image only on the board is pulled, unless it was synced before - then it was deleted locally
+#     and is deleted from the board
+#   - images the same as at the last sync are not transferred at all
+#   - an image on both with no hash from a last sync (the first sync with a board) is hashed on the
+#     board, only if it differs is it pushed
+def sync_f(dir, dry_run=False):
+
+    # THE PLAN AND THE CURRENTLY LOADED CHECK ARE FROM WHAT THE BOARD HAS NOW, NOT THE CACHE
+    (a_lib, d_dsk) = fetch('lib', 'dsk', confirm=True)
+
+    manifest_name = os.path.join(dir, SYNC_MANIFEST)
+    try:
+        with open(manifest_name) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        manifest = { }
+    synced = manifest.setdefault(baseurl, { })
+
+    local = { }
+    for n in sorted(os.listdir(dir)):
+        if (n.endswith('.dsk') or n.endswith('.hdd')) and os.path.isfile(os.path.join(dir, n)):
+            local[n] = file_hash(os.path.join(dir, n))
+
+    # WHAT THE BOARD HAS THAT THE MANIFEST DOES NOT KNOW IS TAKEN AS SYNCED IF IT IS THE SAME
+    unknown = [ n for n in local if n in a_lib and n not in synced ]
+    with ThreadPoolExecutor(SYNC_JOBS) as pool:
+        for (n, h) in zip(unknown, pool.map(lambda n: board_hash(n, os.path.getsize(os.path.join(dir, n))), unknown)):
+            if h == local[n]:
+                synced[n] = h
+
+    plan = [ ]
+    for n in local:
+        if n not in a_lib:
+            plan.append(('PUSH', n))
+        elif local[n] != synced.get(n):
+            plan.append(('REPLACE', n))
+    for n in a_lib:
+        if n not in local and (n.endswith('.dsk') or n.endswith('.hdd')):
+            plan.append(('DELETE' if n in synced else 'PULL', n))
+
+    for n in list(synced):
+        if n not in local and n not in a_lib:
+            del synced[n]
+
+    def apply(step):
+        (action, n) = step
+        path = os.path.join(dir, n)
+        label = f'LIB: SYNC {action} {n}'
+
+        if action in ('REPLACE', 'DELETE') and n in d_dsk.values():
+            return (step, False, f'{label} failed - currently loaded')
+        if dry_run:
+            return (step, True, label)
+
+        if action in ('REPLACE', 'DELETE'):
+            res = session().delete(baseurl + '/library', data=n)
+            if res.status_code != 200:
+                return (step, False, f'{label} failed - server error ({res.status_code})')
+            if action == 'DELETE':
+                return (step, True, f'{label} success')
+
+        if action == 'PULL':
+            (ok, msg) = download(baseurl + '/imsai/disks/' + n, path, label, quiet=True)
+        else:
+            try:
+                (ok, msg) = upload(baseurl + '/library?' + n, path, label, quiet=True)
+            except Exception as e:
+                (ok, msg) = (False, f'{label} failed - {e}')
+            if not ok and action == 'REPLACE':
+                msg += f' - {n} WAS DELETED AND IS NOW MISSING FROM LIB:'
+        return (step, ok, msg)
+
+    done = 0
+    with ThreadPoolExecutor(SYNC_JOBS) as pool:
+        for r in as_completed([ pool.submit(apply, step) for step in plan ]):
+            ((action, n), ok, msg) = r.result()
+            report(ok, msg)
+            if ok and not dry_run:
+                done += 1
+                if action == 'DELETE':
+                    synced.pop(n, None)
+                elif action == 'PULL':
+                    synced[n] = file_hash(os.path.join(dir, n))
+                else:
+                    synced[n] = local[n]
+
+    # WHAT IS ON BOTH AND WAS NOT TRANSFERRED IS AS LAST SYNCED
+    if not dry_run:
+        with open(manifest_name, 'w') as f:
+            json.dump(manifest, f, indent=4)
+        if done:
+            invalidate('lib')
+
+    print(f'LIB: SYNC {"would make" if dry_run else "made"} {len(plan) if dry_run else done} of {len(plan)} changes, ' +
+          f'{len([ n for n in local if n in a_lib ]) - len([ s for s in plan if s[0] == "REPLACE" ])} images unchanged')
 
 
 def lib_f(args):
+    if len(args) >= 2 and args[0] == '--sync':
+        return sync_f(args[1], '--dry-run' in args[2:])
+
+    if len(args) == 0 or args[0] == '--delete':
+        (a_lib, d_dsk) = fetch('lib', 'dsk', confirm=len(args) > 0)
+    else:
+        a_lib = fetch('lib', confirm=args[0] == '--upload')
     # print(json.dumps(a_lib, indent=4))
     if len(args) == 0:
         for l in sorted(a_lib):
@@ -156,58 +508,49 @@ def lib_f(args):
         if action == '--upload' and len(args) >= 2:
             lib_name = args[1]
             if lib_name in a_lib:
-                print('LIB: UPLOAD ' + lib_name + ' already exists in LIB:')
+                fail('LIB: UPLOAD ' + lib_name + ' already exists in LIB:')
             elif lib_name.endswith('.dsk') or lib_name.endswith('.hdd'):
                 print('LIB: UPLOAD ' + lib_name)
                 if not os.path.exists(lib_name):
-                    print('LIB: UPLOAD ' + lib_name + ' does not exist ?')
+                    fail('LIB: UPLOAD ' + lib_name + ' does not exist ?')
                 else:
-                    files = open(lib_name, 'rb')
-                    lib_file = requests.put(baseurl + '/library?' + lib_name,
-                                            data=files)
-                    if lib_file.status_code == 200:
-                        fmt = 'LIB: UPLOAD success - {} bytes uploaded to {}'
-                        res = lib_file.json()
-                        print(fmt.format(res['size'], res['filename']))
-                    else:
-                        fmt = 'CFG: UPLOAD failed - server error ({})'
-                        print(fmt.format(lib_file.status_code))
+                    report(*upload(baseurl + '/library?' + lib_name, lib_name, 'LIB: UPLOAD'))
+                    invalidate('lib')
             else:
-                print('LIB: UPLOAD ' + lib_name +
-                      ' does not look like a disk image ?')
+                fail('LIB: UPLOAD ' + lib_name +
+                     ' does not look like a disk image ?')
         elif action == '--delete' and len(args) >= 2:
             lib_name = args[1]
             if lib_name in a_lib:
                 if lib_name in d_dsk.values():
                     fmt = 'LIB: --DELETE failed - {} currently loaded'
-                    print(fmt.format(lib_name))
+                    fail(fmt.format(lib_name))
                 else:
-                    lib_file = requests.delete(baseurl + '/library',
+                    lib_file = session().delete(baseurl + '/library',
                                                data=lib_name)
+                    invalidate('lib')
                     if lib_file.status_code == 200:
                         print('LIB: --DELETE success - deleted ' + lib_name +
                               ' from LIB:')
                     else:
                         fmt = 'LIB: --DELETE failed - server error ({})'
-                        print(fmt.format(lib_file.status_code))
+                        fail(fmt.format(lib_file.status_code))
             else:
-                print('LIB: --DELETE ' + lib_name + ' ?')
+                fail('LIB: --DELETE ' + lib_name + ' ?')
         else:
             lib_name = action
             if lib_name in a_lib:
-                lib_file = requests.get(baseurl + '/imsai/disks/' + lib_name)
-                if lib_file.status_code == 200:
-                    # print(lib_file.reponse)
-                    files = open(lib_name, 'wb')
-                    files.write(lib_file.content)
-                    files.close()
+                (ok, res) = download(baseurl + '/imsai/disks/' + lib_name, lib_name, 'LIB: DOWNLOAD')
+                if ok == None:
+                    fail('ERROR: could not open ' + lib_name)
                 else:
-                    print('ERROR: could not open ' + lib_name)
+                    report(ok, res)
             else:
-                print('LIB: ' + lib_name + ' ?')
+                fail('LIB: ' + lib_name + ' ?')
 
 
 def man_f(args):
+    a_man = fetch('man')
     # print(json.dumps(o_man, indent=4))
     for m in sorted(a_man):
         fmt = '\t{}'
@@ -216,6 +559,7 @@ def man_f(args):
 
 
 def conf_f(args):
+    a_conf = fetch('conf')
     # print(json.dumps(a_conf, indent=4)
     if len(args) == 0:
         for c in sorted(a_conf):
@@ -228,36 +572,295 @@ def conf_f(args):
             if cfg_name in a_conf:
                 print('CFG: UPLOAD ' + cfg_name)
                 if not os.path.exists(cfg_name):
-                    print('CFG: UPLOAD' + cfg_name + ' does not exist ?')
+                    fail('CFG: UPLOAD' + cfg_name + ' does not exist ?')
                 else:
-                    files = open(cfg_name, 'rb')
-                    cfg_file = requests.put(baseurl + '/conf?' + cfg_name,
-                                            data=files)
-                    if cfg_file.status_code == 200:
-                        fmt = 'CFG: UPLOAD success - {} bytes uploaded to {}'
-                        res = cfg_file.json()
-                        print(fmt.format(res['size'], res['filename']))
-                    else:
-                        fmt = 'CFG: UPLOAD failed - server error ({})'
-                        print(fmt.format(cfg_file.status_code))
+                    report(*upload(baseurl + '/conf?' + cfg_name, cfg_name, 'CFG: UPLOAD'))
+                    invalidate('conf')
             else:
-                print('CFG: UPLOAD ' + cfg_name + ' ?')
+                fail('CFG: UPLOAD ' + cfg_name + ' ?')
         else:
             cfg_name = action
             if cfg_name in a_conf:
-                cfg_file = requests.get(baseurl + '/imsai/conf/' + cfg_name)
+                cfg_file = session().get(baseurl + '/imsai/conf/' + cfg_name)
                 if cfg_file.status_code == 200:
                     print(cfg_file.text)
                 else:
-                    print('ERROR: could not open ' + cfg_name)
+                    fail('ERROR: could not open ' + cfg_name)
+            else:
+                fail('CFG: ' + cfg_name + ' ?')
+
+
+MEM_SZ = 0x10000
+MEM_JOBS = 4
+MEM_CHUNKS = (0x1000, 0x800, 0x400, 0x200, 0x100, 0x80)
+_mem_chunk = None
+
+
+# THE LARGEST READ OF /dma THE FIRMWARE ANSWERS IN FULL, TRIED ONCE PER RUN
+def mem_chunk():
+    global _mem_chunk
+    if _mem_chunk == None:
+        _mem_chunk = MEM_CHUNKS[-1]
+        for n in MEM_CHUNKS:
+            res = session().get(f'{baseurl}/dma?m=0000&n={n:02X}')
+            if res.status_code == 200 and len(res.content) == n:
+                _mem_chunk = n
+                break
+    return _mem_chunk
+
+
+# READ OR WRITE A RANGE OF MEMORY IN CHUNKS, SEVERAL IN FLIGHT AT ONCE OVER THE POOLED SESSION
+def mem_read(start, length):
+    n = mem_chunk()
+
+    def get(m):
+        size = min(n, start + length - m)
+        res = session().get(f'{baseurl}/dma?m={m:04X}&n={size:02X}')
+        if res.status_code != 200 or len(res.content) != size:
+            raise IOError(f'read of {size} bytes at {m:04X} failed ({res.status_code})')
+        return res.content
+
+    with ThreadPoolExecutor(MEM_JOBS) as pool:
+        return b''.join(pool.map(get, range(start, start + length, n)))
+
+
+def mem_write(ranges, n=None):
+    n = n or mem_chunk()
+
+    def put(piece):
+        (m, data) = piece
+        res = session().put(f'{baseurl}/dma?m={m:04X}&n={len(data):02X}', data=data)
+        if res.status_code != 200:
+            raise IOError(f'write of {len(data)} bytes at {m:04X} failed ({res.status_code})')
+
+    pieces = [ (m + i, data[i: i + n]) for (m, data) in ranges for i in range(0, len(data), n) ]
+    with ThreadPoolExecutor(MEM_JOBS) as pool:
+        list(pool.map(put, pieces))
+    return len(pieces)
+
+
+# WRITE ranges OF data (AT start), THEN READ IT BACK - A BOARD THAT TAKES LESS THAN A CHUNK PER PUT
+# (THE FIF SERVERS MOVE 0x80) STILL ANSWERS 200, SO WHAT DIFFERS IS WRITTEN AGAIN 0x80 AT A TIME
+# RETURNS (writes, ranges still different)
+def mem_restore(start, data, ranges):
+    count = mem_write(ranges)
+    changes = mem_changes(mem_read(start, len(data)), data)
+    if len(changes):
+        count += mem_write([ (start + a, data[a: b]) for (a, b) in changes ], MEM_CHUNKS[-1])
+        changes = mem_changes(mem_read(start, len(data)), data)
+    return (count, changes)
+
+
+def mem_failed(changes):
+    return f'MEM: RESTORE failed - {len(changes)} ranges, {sum(b - a for (a, b) in changes)} bytes differ after writing'
+
+
+# THE RANGES (start, end) WHERE a AND b DIFFER, BYTES LESS THAN gap APART ARE TAKEN AS ONE RANGE
+def mem_changes(a, b, gap=8):
+    ranges = [ ]
+    for i in range(len(a)):
+        if a[i] != b[i]:
+            if len(ranges) and i - ranges[-1][1] <= gap:
+                ranges[-1][1] = i + 1
+            else:
+                ranges.append([ i, i + 1 ])
+    return ranges
+
+
+def hex_lines(addr, data):
+    for i in range(0, len(data), 16):
+        line = data[i: i + 16]
+        text = ''.join(chr(c) if 32 <= c < 127 else '.' for c in line)
+        yield f'{addr + i:04X}  {line.hex(" ").upper():47}  {text}'
+
+
+# ADDRESSES ARE HEX, AN END IS INCLUSIVE OR +length
+def mem_range(args):
+    start = int(args[0], 16) if len(args) >= 1 else 0
+    if len(args) >= 2:
+        end = start + int(args[1][1:], 16) if args[1].startswith('+') else int(args[1], 16) + 1
+    else:
+        end = MEM_SZ
+    if not 0 <= start < end <= MEM_SZ:
+        raise ValueError(f'{start:04X}-{end - 1:04X} is not a memory range')
+    return (start, end - start)
+
+
+def mem_f(args):
+
+    action = args[0] if len(args) else ''
+    begin = time.perf_counter()
+
+    # --restore --diff file AND --restore file --diff ARE THE SAME
+    changed_only = action == '--restore' and '--diff' in args[1:]
+    if changed_only:
+        args = [ action ] + [ a for a in args[1:] if a != '--diff' ]
+
+    try:
+        if action == '--dump' and len(args) >= 2:
+            (start, length) = mem_range(args[2:])
+            data = mem_read(start, length)
+            with open(args[1], 'wb') as f:
+                f.write(data)
+            print(f'MEM: DUMP {start:04X}-{start + length - 1:04X} to {args[1]} - {length} bytes in {time.perf_counter() - begin:.2f}s')
+
+        elif action in ('--restore', '--diff') and len(args) >= 2:
+            with open(args[1], 'rb') as f:
+                data = f.read()
+            # THE WHOLE FILE MUST FIT IN MEMORY FROM start, IT IS NOT CUT SHORT AT FFFF
+            if len(data) == 0:
+                raise ValueError(f'{args[1]} is empty')
+            (start, length) = mem_range([ args[2] if len(args) >= 3 and not args[2].startswith('--') else '0',
+                                          f'+{len(data):X}' ])
+
+            if action == '--restore' and not changed_only:
+                (count, failed) = mem_restore(start, data, [ (start, data) ])
+                if len(failed):
+                    fail(mem_failed(failed))
+                    return
+                print(f'MEM: RESTORE {start:04X}-{start + len(data) - 1:04X} from {args[1]} - {len(data)} bytes in {count} writes, {time.perf_counter() - begin:.2f}s')
+                return
+
+            board = mem_read(start, len(data))
+            changes = mem_changes(board, data)
+
+            if action == '--diff':
+                for (a, b) in changes:
+                    print(f'MEM: {start + a:04X}-{start + b - 1:04X} differs ({b - a} bytes)')
+                    for (old, new) in zip(hex_lines(start + a, board[a: b]), hex_lines(start + a, data[a: b])):
+                        print(f'	- {old}')
+                        print(f'	+ {new}')
+                print(f'MEM: DIFF {len(changes)} ranges, {sum(b - a for (a, b) in changes)} bytes differ from {args[1]}')
             else:
-                print('CFG: ' + cfg_name + ' ?')
+                (count, failed) = mem_restore(start, data, [ (start + a, data[a: b]) for (a, b) in changes ])
+                if len(failed):
+                    fail(mem_failed(failed))
+                    return
+                print(f'MEM: RESTORE {len(changes)} changed ranges from {args[1]} - {sum(b - a for (a, b) in changes)} bytes in {count} writes, {time.perf_counter() - begin:.2f}s')
+
+        elif action == '' or not action.startswith('--'):
+            (start, length) = mem_range(args if action else [ '0000', '+100' ])
+            for l in hex_lines(start, mem_read(start, length)):
+                print('\t' + l)
+
+        else:
+            fail('MEM: ' + action + ' ?')
+
+    except (ValueError, IOError) as e:
+        fail(f'MEM: failed - {e}')
+
+
+# THE CPA STATE STRING, eg. UIRW-, AS ITS LIGHTS AND POWER SWITCH
+def cpa_lights(cpa):
+    return {
+        'INTR.EN': int(cpa[1] == 'I'),
+        'RUN': int(cpa[2] == 'R'),
+        'WAIT': int(cpa[3] == 'W'),
+        'HOLD': int(cpa[4] == 'H'),
+        'PWR': int(cpa[0] == 'U')
+    }
+
+
+def cpa_text(cpa):
+    state = ''
+    if cpa[1] == 'I':
+        state += 'INTR.EN '
+    if cpa[2] == 'R':
+        state += 'RUN '
+    if cpa[3] == 'W':
+        state += 'WAIT '
+    if cpa[4] == 'H':
+        state += 'HOLD '
+    if cpa[0] == 'U':
+        state += 'PWR.ON'
+    if cpa[0] == 'D':
+        state += 'PWR.OFF'
+    return state
+
+
+# FOLLOW THE CPA ON THE OPEN SOCKET, SHOWING ONLY THE TRANSITIONS - THE STATE THE BOARD PUSHES IS
+# TAKEN AS IT ARRIVES, WHEN IT IS QUIET FOR interval SECONDS IT IS ASKED ON THE SAME SOCKET, UNTIL
+# THE BOARD IS SEEN TO PUSH (A STATE ARRIVES WITH NO ASK OUTSTANDING) - THEN IT IS ONLY LISTENED TO
+# TIMES ARE FROM start, WHEN THE KEY WAS SENT
+# ENDS WHEN ALL OF until (eg. { 'RUN': 0 }) BECOME TRUE, OR ON ^C
+def cpa_watch(cpa, until, as_json=False, interval=0.1, start=None):
+
+    wall = time.time()
+    now = time.perf_counter()
+    if start == None:
+        start = now
+    wall -= now - start
+    ws = cpa_socket()
+
+    def show(cpa, last, now):
+        lights = cpa_lights(cpa)
+        changed = [ k for k in lights if last == None or lights[k] != last[k] ]
+        if as_json:
+            print(json.dumps({ 'time': round(wall + now - start, 6), 'elapsed': round(now - start, 6),
+                               'state': lights, 'changed': changed }), flush=True)
+        else:
+            print(f'{now - start:12.6f}s CPA: {cpa_text(cpa):30} ' +
+                  ' '.join(f'{k}={lights[k]}' for k in changed), flush=True)
+        return lights
+
+    last = show(cpa, None, time.perf_counter())
+    asked = 0
+    pushes = False
+    try:
+        while True:
+            cpa = cpa_recv(ws, interval)
+            now = time.perf_counter()
+            if cpa == None:
+                if not pushes and asked == 0:
+                    ws.send('P')
+                    asked += 1
+                continue
+            if asked:
+                asked -= 1
+            else:
+                pushes = True
+
+            if cpa_lights(cpa) != last:
+                was = all(last[k] == v for (k, v) in until.items())
+                last = show(cpa, last, now)
+                if until and not was and all(last[k] == v for (k, v) in until.items()):
+                    break
+    except KeyboardInterrupt:
+        pass
 
 
 def cpa_f(args):
 
     msg = ''
 
+    watch = '--watch' in args
+    as_json = '--json' in args
+    until = { }
+    interval = 0.1
+    rest = [ ]
+    while len(args):
+        a = args.pop(0)
+        if a == '--until' and len(args):
+            for cond in args.pop(0).split(','):
+                (k, _, v) = cond.partition('=')
+                if k.upper() not in ('INTR.EN', 'RUN', 'WAIT', 'HOLD', 'PWR') or \
+                   v.upper() not in ('0', '1', 'OFF', 'ON'):
+                    fail('CPA: --until ' + cond + ' ?')
+                    return
+                until[k.upper()] = 1 if v.upper() in ('1', 'ON') else 0
+        elif a == '--interval' and len(args):
+            a = args.pop(0)
+            try:
+                interval = float(a)
+            except ValueError:
+                interval = 0
+            if not interval > 0:
+                fail('CPA: --interval ' + a + ' ?')
+                return
+        elif a not in ('--watch', '--json'):
+            rest.append(a)
+    args = rest
+
     if len(args) == 0:
         msg = 'P'
         action = '\b'
@@ -279,30 +882,232 @@ def cpa_f(args):
             print('CPA: EXTCLR')
             msg = 'cdP'
         else:
-            print('CPA: ' + action + ' ?')
+            fail('CPA: ' + action + ' ?')
 
     if msg != '':
-        ws = websocket.WebSocket()
-        ws.connect(baseurl.replace('http', 'ws', 1) + '/cpa')
-        ws.send(msg)
-        cpa = ws.recv()
-        ws.close()
-
-        state = ''
-        if cpa[1] == 'I':
-            state += 'INTR.EN '
-        if cpa[2] == 'R':
-            state += 'RUN '
-        if cpa[3] == 'W':
-            state += 'WAIT '
-        if cpa[4] == 'H':
-            state += 'HOLD '
-        if cpa[0] == 'U':
-            state += 'PWR.ON'
-        if cpa[0] == 'D':
-            state += 'PWR.OFF'
-
-        print('CPA: ' + state)
+        sent = time.perf_counter()
+        cpa = cpa_send(msg)
+
+        if watch:
+            cpa_watch(cpa, until, as_json, interval, sent)
+        else:
+            print('CPA: ' + cpa_text(cpa))
+
+
+# ONE /cpa WEBSOCKET, KEPT OPEN FOR EVERY cpa: COMMAND OF A SHELL OR SCRIPT
+def cpa_socket():
+    global _cpa_ws
+    if _cpa_ws == None:
+        import websocket
+        _cpa_ws = websocket.WebSocket()
+        _cpa_ws.connect(baseurl.replace('http', 'ws', 1) + '/cpa')
+    return _cpa_ws
+
+
+def cpa_close():
+    global _cpa_ws
+    if _cpa_ws != None:
+        _cpa_ws.close()
+        _cpa_ws = None
+
+
+# THE NEXT STATE FROM THE SOCKET WITHIN timeout SECONDS, OR None - THE SOCKET ITSELF IS NOT select()ED
+# AS websocket-client MAY ALREADY HOLD A FRAME (OR PART OF ONE), A TIMED OUT recv KEEPS WHAT IT HAS READ
+def cpa_recv(ws, timeout):
+    import websocket
+    ws.settimeout(timeout)
+    try:
+        return ws.recv()
+    except websocket.WebSocketTimeoutException:
+        return None
+    finally:
+        ws.settimeout(None)
+
+
+# SEND A KEY TO THE CPA AND RETURN THE STATE IT ANSWERS WITH - ANY STATE PUSHED SINCE THE LAST KEY
+# IS DISCARDED FIRST, A SOCKET THE BOARD HAS CLOSED IS OPENED AGAIN
+def cpa_send(msg):
+    for retry in (True, False):
+        try:
+            ws = cpa_socket()
+            while cpa_recv(ws, 0.001) != None:
+                pass
+            ws.send(msg)
+            return ws.recv()
+        except Exception:
+            cpa_close()
+            if not retry:
+                raise
+
+
+# RUN ONE COMMAND ON MANY BOARDS - EACH IN ITS OWN imsai PROCESS, SO A HUNG BOARD IS KILLED AT ITS TIMEOUT
+def fleet_f(hosts, args, jobs=8, timeout=30, as_json=False):
+    global failures
+
+    def run(host):
+        start = time.perf_counter()
+        try:
+            res = subprocess.run([sys.executable, os.path.abspath(sys.argv[0]), '--host', host] + args,
+                                 capture_output=True, text=True, timeout=timeout)
+            status = 'OK' if res.returncode == 0 else f'EXIT {res.returncode}'
+            output = (res.stdout + res.stderr).rstrip()
+            if res.returncode != 0 and res.stderr:
+                output = res.stderr.rstrip().splitlines()[-1]
+        except subprocess.TimeoutExpired:
+            status = 'TIMEOUT'
+            output = f'no answer in {timeout}s'
+        return (host, status, output, time.perf_counter() - start)
+
+    with ThreadPoolExecutor(min(jobs, len(hosts))) as pool:
+        if as_json:
+            for r in as_completed([ pool.submit(run, h) for h in hosts ]):
+                (host, status, output, secs) = r.result()
+                print(json.dumps({ 'host': host, 'status': status, 'seconds': round(secs, 3), 'output': output }), flush=True)
+                failures += status != 'OK'
+        else:
+            width = max(12, max(len(h) for h in hosts))
+            print(f'{"HOST":{width}} {"STATUS":8} {"TIME":>7}  OUTPUT')
+            print(f'{"-" * width} {"-" * 8} {"-" * 7}  {"-" * 6}')
+            for (host, status, output, secs) in pool.map(run, hosts):
+                lines = output.splitlines() or [ '' ]
+                print(f'{host:{width}} {status:8} {secs:6.2f}s  {lines[0]}')
+                failures += status != 'OK'
+                for l in lines[1:]:
+                    print(f'{"":{width}} {"":8} {"":7}  {l}')
+
+
+def read_inventory(name):
+    hosts = [ ]
+    with open(name) as f:
+        for l in f:
+            l = l.split('#', 1)[0].strip()
+            if l:
+                hosts.extend(l.replace(',', ' ').split())
+    return hosts
+
+
+# RUN ONE COMMAND LINE, AS GIVEN AFTER imsai
+def run_f(args):
+    if len(args) == 0:
+        help_f(args)
+    else:
+        sect = args[0]
+        if sect in sections:
+            if sections[sect]:
+                sections[sect](args[1:])
+            else:
+                fail(sect + ' ?')
+        elif sect.endswith(':dsk:') and sect[:-5].upper() in fetch('dsk').keys():
+            xdsk_f(sect, args[1:])
+        else:
+            fail(sect + ' ?')
+
+
+# THE WORDS THAT MAY FOLLOW A COMMAND, FOR COMPLETION IN THE SHELL
+def completions(words):
+    if len(words) == 0:
+        return [ s for s in sections if s not in ('x:dsk:', '-h', '--help') ] + \
+               [ d.lower() + ':dsk:' for d in fetch('dsk') ] + [ 'quit' ]
+
+    sect = words[0]
+    if sect == 'help':
+        return [ s for s in sections if ':' in s ] + [ 'all' ]
+    if sect == 'sys:':
+        return [ '--reboot', '--update', 'tasks' ] + list(fetch('sys'))
+    if sect == 'cpa:':
+        return [ 'run', 'stop', 'step', 'reset', 'extclr', '--watch', '--until', '--json', '--interval' ]
+    if sect == 'cfg:':
+        return [ '--upload' ] + sorted(fetch('conf'))
+    if sect == 'mem:':
+        if words[-1] in ('--dump', '--restore', '--diff'):
+            return os.listdir('.')
+        return [ '--dump', '--restore', '--diff' ]
+    if sect == 'lib:':
+        if words[-1] in ('--upload', '--sync'):
+            return os.listdir('.')
+        return [ '--upload', '--delete', '--sync' ] + sorted(fetch('lib'))
+    if sect.endswith(':dsk:'):
+        if words[-1] == '--load':
+            return sorted(fetch('lib'))
+        return [ '--eject', '--load' ]
+    return [ ]
+
+
+# A SHELL (OR A SCRIPT OF COMMANDS, ONE PER LINE) RUN WITH ONE HTTP SESSION AND ONE /cpa SOCKET
+# THE LISTINGS ARE TAKEN FROM THE CACHE, SO THEY ARE ONLY FETCHED AGAIN AFTER A CHANGE OR THEIR ttl
+def shell_f(script=None):
+
+    interactive = script == None and sys.stdin.isatty()
+    prompt = cmd + '> '
+
+    if interactive:
+        try:
+            import readline
+
+            def complete(text, state):
+                words = readline.get_line_buffer()[:readline.get_begidx()].split()
+                try:
+                    options = [ o for o in completions(words) if o.startswith(text) ]
+                except Exception:
+                    options = [ ]
+                return options[state] + ' ' if state < len(options) else None
+
+            readline.set_completer(complete)
+            readline.set_completer_delims(' \t\n')
+            readline.parse_and_bind('tab: complete')
+        except ImportError:
+            pass
+        source = None
+    elif script in (None, '-'):
+        source = sys.stdin
+    else:
+        source = open(script)
+
+    while True:
+        try:
+            if interactive:
+                line = input(prompt)
+            else:
+                line = source.readline()
+                if not line:
+                    break
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    print(prompt + line)
+        except EOFError:
+            print()
+            break
+        except KeyboardInterrupt:
+            print()
+            continue
+
+        if line.startswith('#'):
+            continue
+        try:
+            args = shlex.split(line)
+        except ValueError as e:
+            fail('ERROR: ' + str(e))
+            continue
+        if len(args) == 0:
+            continue
+        if args[0] in ('quit', 'exit'):
+            break
+
+        _fetched.clear()
+        try:
+            run_f(args)
+        except KeyboardInterrupt:
+            print()
+        except SystemExit as e:
+            if e.code not in (None, 0):
+                print(e.code)
+        except Exception as e:
+            fail(f'ERROR: {e}')
+        sys.stdout.flush()
+
+    if source not in (None, sys.stdin):
+        source.close()
+    cpa_close()
 
 
 def help_f(args):
@@ -311,11 +1116,19 @@ def help_f(args):
 
     if len(args) == 0:
         sect = ''
-        print('\tusage: ' + cmd +
-              ' {sys: | dsk: | x:dsk: | lib: | man: | cfg: | cpa:}')
+        print('\tusage: ' + cmd + ' [--host host | --hosts host,... | --inventory file]' +
+              ' {sys: | dsk: | x:dsk: | lib: | man: | cfg: | cpa: | mem: | shell | -f script}')
         print('\tfor help on a device use: ' + cmd + ' help [device | all]')
         print('\t- device (optional) - one of the listed devices')
         print('\t- all (optional) - show all help')
+        print('\t- --host host (optional) - the board to manage, a name or url')
+        print('\t- --hosts host,... | --inventory file (optional) - run the command on each board in parallel')
+        print('\t  (the inventory lists one or more hosts per line, # starts a comment)')
+        print('\t  --jobs n - boards at once (default 8), --timeout s - per board (default 30)')
+        print('\t  --json - JSON lines instead of a table')
+        print('\t- --refresh (optional) - ask the board for every listing, not the cache in ' + CACHE_DIR)
+        print('\t- shell - run commands as typed (with tab completion), quit or ^D to end')
+        print('\t- -f script - run the commands in the script, one per line (# for comments), - for stdin')
 
     else:
         sect = args[0]
@@ -353,7 +1166,7 @@ def help_f(args):
 
         elif sect == 'lib:':
             print('\tusage: ' + cmd +
-                  ' lib: [{--upload | --delete}] [disk_image]')
+                  ' lib: [{--upload | --delete}] [disk_image] | --sync directory [--dry-run]')
             print(
                 '\tshow the contents of the disk library - loaded disk images are prefixed with an asterix (*)'
             )
@@ -366,6 +1179,12 @@ def help_f(args):
             print(
                 '\t- --delete disk_image (optional) - deletes the library image from LIB:'
             )
+            print(
+                '\t- --sync directory (optional) - make LIB: the same as the local directory of master images,'
+            )
+            print(
+                '\t  transferring only the images added, changed or deleted since the last sync (--dry-run to list them)'
+            )
 
         elif sect == 'man:':
             print('\tusage: ' + cmd + ' man:')
@@ -382,15 +1201,33 @@ def help_f(args):
                 '\t- --upload config_name (optional) - upload the contents of the config file'
             )
 
+        elif sect == 'mem:':
+            print('\tusage: ' + cmd + ' mem: [start [end | +length]] | --dump file [start [end | +length]] |' +
+                  ' {--restore [--diff] | --diff} file [start]')
+            print('\tshow memory as hex, addresses and lengths are in hex (default the first 256 bytes)')
+            print('\t- --dump file (optional) - save the range (default all 64K) to the local file')
+            print('\t- --restore file (optional) - load the local file into memory at start (default 0000)')
+            print('\t  with --diff only the ranges that differ are written')
+            print('\t- --diff file (optional) - show the ranges where memory differs from the local file')
+
         elif sect == 'cpa:':
             print('\tusage: ' + cmd +
-                  ' cpa: {[run | stop | step | reset | extclr]}')
+                  ' cpa: {[run | stop | step | reset | extclr]} [--watch [--until light=0|1,...] [--json] [--interval s]]')
             print(
                 '\tshow the current state of the CPA: control lights and power switch'
             )
             print(
                 '\t- key (optional) - press/depress the corresponding key on the CPA:'
             )
+            print(
+                '\t- --watch (optional) - then keep watching, showing each change of state timed from the start'
+            )
+            print(
+                '\t- --until light=0|1 (optional) - stop watching when the lights (INTR.EN, RUN, WAIT, HOLD, PWR) change to that'
+            )
+            print(
+                '\t- --json (optional) - each change as a JSON line, --interval s - ask for the state when quiet (default 0.1)'
+            )
         else:
             print('HELP ' + sect + ' ?')
 
@@ -403,6 +1240,7 @@ sections = {
     'man:': man_f,
     'cfg:': conf_f,
     'cpa:': cpa_f,
+    'mem:': mem_f,
     'help': help_f,
     '-h': help_f,
     '--help': help_f
@@ -410,16 +1248,40 @@ sections = {
 
 args = sys.argv[1:]
 
-if len(args) == 0:
-    help_f(args)
-elif len(args) >= 1:
-    sect = args[0]
-    if sect in sections:
-        if sections[sect]:
-            sections[sect](args[1:])
-        else:
-            print(sect + ' ?')
-    elif sect.endswith(':dsk:') and sect[:-5].upper() in d_dsk.keys():
-        xdsk_f(sect, args[1:])
-    else:
-        print(sect + ' ?')
\ No newline at end of file
+hosts = [ ]
+fleet = { }
+while len(args) >= 1 and args[0] in ('--host', '--hosts', '--inventory', '--jobs', '--timeout', '--json', '--refresh'):
+    opt = args.pop(0)
+    if opt == '--json':
+        fleet['as_json'] = True
+    elif opt == '--refresh':
+        use_cache = False
+    elif len(args) == 0:
+        sys.exit(opt + ' ?')
+    elif opt == '--host':
+        host = args.pop(0)
+        baseurl = host if '://' in host else 'http://' + host
+    elif opt == '--hosts':
+        hosts.extend(h for h in args.pop(0).split(',') if h)
+    elif opt == '--inventory':
+        hosts.extend(read_inventory(args.pop(0)))
+    elif opt in ('--jobs', '--timeout'):
+        value = args.pop(0)
+        try:
+            fleet[opt[2:]] = int(value) if opt == '--jobs' else float(value)
+        except ValueError:
+            fleet[opt[2:]] = 0
+        if not fleet[opt[2:]] > 0:
+            sys.exit(f'{opt} {value} ? - usage: {opt} {"processes" if opt == "--jobs" else "seconds"}, more than 0')
+
+if len(hosts) and len(args) >= 1 and args[0] not in ('help', '-h', '--help'):
+    fleet_f(hosts, args if use_cache else [ '--refresh' ] + args, **fleet)
+elif len(args) >= 1 and args[0] == 'shell':
+    shell_f()
+elif len(args) >= 2 and args[0] == '-f':
+    shell_f(args[1])
+else:
+    run_f(args)
+
+if failures:
+    sys.exit(1)
\ No newline at end of file
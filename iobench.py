@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+##
+#   iobench.py
+#
+#   Copyright (C) David McNaughton 2023-present
+#
+#   a benchmark of the per-callback latency of the IO endpoint used by the remote port servers
+#   each callback is a FIF read: the IMSAI8080esp POSTs a descriptor to /{SRV_PATH}?p=FD and
+#   the server PUTs a sector and then the result back to /dma before it answers
+#
+#   everything runs on localhost, a fake board serves /dma from a 64K bytearray
+#   iosrv.py is always measured, simple_http_server + requests (the original servers) if installed
+#
+#   usage:
+#       python3 iobench.py [callbacks]      - default 2000
+#
+#   dependencies:
+#       python3
+#       iosrv.py                    - alongside this file
+#       requests, simple_http_server (modules) - optional, for the comparison
+#
+#   history:
+#        17-OCT-2026     1.0     Initial release
+##
+
+import sys
+import time
+import asyncio
+import http.client
+from threading import Thread
+from importlib.util import find_spec
+from urllib.parse import urlsplit, parse_qs
+import iosrv
+
+BOARD_PORT = 18080
+SRV_PORT = 18253
+SRV_PATH = 'iobench'
+SEC_SZ = 128
+
+mem = bytearray(range(256)) * 256
+
+
+# THE FAKE BOARD - GET/PUT /dma?m=XXXX&n=NN ON KEEP-ALIVE CONNECTIONS
+async def board(reader, writer):
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        method, target, version = line.decode('latin-1').split()
+        headers = await iosrv.read_headers(reader)
+        body = await iosrv.read_body(reader, headers)
+
+        query = parse_qs(urlsplit(target).query)
+        m = int(query['m'][0], 16)
+        n = int(query.get('n', ['1'])[0], 16)
+        if method == 'GET':
+            data = bytes(mem[m:m + n])
+        else:
+            mem[m:m + len(body)] = body
+            data = b'OK'
+        writer.write(b'HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n' % len(data) + data)
+        await writer.drain()
+    writer.close()
+
+
+def run_board():
+    async def start():
+        srv = await asyncio.start_server(board, '127.0.0.1', BOARD_PORT)
+        async with srv:
+            await srv.serve_forever()
+    asyncio.run(start())
+
+
+# THE FIF READ EACH SERVER DOES, ONE ON iosrv AND ONE ON simple_http_server + requests
+dma = iosrv.client(f'http://127.0.0.1:{BOARD_PORT}')
+
+async def iosrv_callback(method, port, body, peer):
+    mem = bytearray(body)
+    addr = (mem[8] << 8) + mem[7]
+    dma_addr = (mem[6] << 8) + mem[5]
+    await iosrv.put(dma, f'/dma?m={dma_addr:04X}&n={SEC_SZ:02X}', bytes(SEC_SZ))
+    await iosrv.put(dma, f'/dma?m={(addr + 1):04X}', b'\x01')
+    return 201
+
+def start_iosrv(port):
+    Thread(target=iosrv.run, args=(f'/{SRV_PATH}', iosrv_callback, port), daemon=True).start()
+
+def start_simple_http_server(port):
+    import requests
+    from simple_http_server import route, server, Response, BytesBody, logger
+    logger.set_level("ERROR")
+    sess = requests.Session()
+
+    @route(f'/{SRV_PATH}', method="POST")
+    def io_out_post(p, b=BytesBody()):
+        mem = bytearray(b)
+        addr = (mem[8] << 8) + mem[7]
+        dma_addr = (mem[6] << 8) + mem[5]
+        sess.put(f'http://127.0.0.1:{BOARD_PORT}/dma?m={dma_addr:04X}&n={SEC_SZ:02X}', data=bytes(SEC_SZ))
+        sess.put(f'http://127.0.0.1:{BOARD_PORT}/dma?m={(addr + 1):04X}', data=b'\x01')
+        return Response(status_code=201)
+
+    Thread(target=server.start, args=("127.0.0.1", port), daemon=True).start()
+
+
+# PLAY THE IMSAI8080esp - ONE KEEP-ALIVE CONNECTION, ONE CALLBACK AT A TIME
+def measure(port, count):
+    conn = None
+    for i in range(50):
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port)
+            conn.connect()
+            break
+        except ConnectionError:
+            time.sleep(0.1)
+
+    desc = bytes([0x21, 0x00, 0x00, 0x02, 0x01, 0x00, 0x80, 0x40, 0x00, 0x00])
+    times = [ ]
+    for i in range(count + count // 10):
+        start = time.perf_counter()
+        try:
+            conn.request('POST', f'/{SRV_PATH}?p=FD', body=desc, headers={'Content-Type': 'application/octet-stream'})
+            res = conn.getresponse()
+        except (ConnectionError, http.client.RemoteDisconnected):
+            # A SERVER THAT DOES NOT KEEP ALIVE COSTS A NEW CONNECTION PER CALLBACK
+            conn.close()
+            conn.request('POST', f'/{SRV_PATH}?p=FD', body=desc, headers={'Content-Type': 'application/octet-stream'})
+            res = conn.getresponse()
+        res.read()
+        times.append(time.perf_counter() - start)
+        if res.status != 201:
+            sys.exit(f'BAD STATUS {res.status}')
+    conn.close()
+
+    times = sorted(times[count // 10:])  # drop the warm up
+    return (sum(times) / len(times), times[len(times) // 2], times[int(len(times) * 0.99)])
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    Thread(target=run_board, daemon=True).start()
+
+    servers = [ ('iosrv', start_iosrv) ]
+    if find_spec('requests') and find_spec('simple_http_server'):
+        servers.append(('simple_http_server', start_simple_http_server))
+    else:
+        print('simple_http_server and/or requests not installed - only iosrv is measured')
+
+    print(f'{"SERVER":20} {"MEAN":>9} {"P50":>9} {"P99":>9}   ({count} callbacks)')
+    for n, (name, start) in enumerate(servers):
+        start(SRV_PORT + n)
+        mean, p50, p99 = measure(SRV_PORT + n, count)
+        print(f'{name:20} {mean * 1e3:7.3f}ms {p50 * 1e3:7.3f}ms {p99 * 1e3:7.3f}ms')
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+##
+#   iosrv.py
+#
+#   Copyright (C) David McNaughton 2023-present
+#
+#   a minimal asyncio HTTP/1.1 keep-alive endpoint for the IO callbacks
+#   the IMSAI8080esp makes to a registered remote port server (PUT/POST /{SRV_PATH}?p=XX)
+#   and a non-blocking keep-alive client for the calls back to its /dma interface
+#
+#   used by fifsrv.py, fifDirSrv.py and lptSrv.py in place of simple_http_server
+#
+#   dependencies:
+#       python3
+#
+#   known issues:
+#       - only the requests the IMSAI8080esp makes are understood,
+#         this is not a general purpose HTTP server
+#
+#   history:
+#        17-OCT-2026     1.0     Initial release
+##
+
+import asyncio
+import inspect
+from urllib.parse import urlsplit, parse_qs
+from logging import debug, error, warning
+
+REASON = { 200: 'OK', 201: 'Created', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 500: 'Internal Server Error' }
+
+
+# READ THE HEADERS OF A REQUEST OR RESPONSE INTO A DICT WITH LOWER CASE NAMES
+async def read_headers(reader):
+
+    headers = { }
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            return headers
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+
+async def read_body(reader, headers, eof=False):
+
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        body = bytearray()
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            if size == 0:
+                await read_headers(reader)  # trailers
+                return bytes(body)
+            body += await reader.readexactly(size)
+            await reader.readline()
+
+    if 'content-length' in headers:
+        return await reader.readexactly(int(headers['content-length']))
+
+    return await reader.read() if eof else b''
+
+
+# SERVER - handler(method, port, body, peer) IS CALLED FOR EVERY CALLBACK TO path
+#   method - 'PUT' or 'POST'
+#   port   - the IO port from p=XX as an int
+#   body   - the raw request body as bytes
+#   peer   - the address of the IMSAI8080esp making the callback
+# AND RETURNS THE STATUS CODE (or None for 200), IT MAY BE A COROUTINE
+async def serve(path, handler, port, host=''):
+
+    async def connection(reader, writer):
+        peer = writer.get_extra_info('peername')[0]
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+
+                method, target, version = line.decode('latin-1').split()
+                headers = await read_headers(reader)
+                body = await read_body(reader, headers)
+
+                url = urlsplit(target)
+                query = parse_qs(url.query)
+
+                if url.path != path:
+                    status = 404
+                elif method not in ('PUT', 'POST'):
+                    status = 405
+                elif 'p' not in query:
+                    status = 400
+                else:
+                    try:
+                        status = handler(method, int(query['p'][0], 16), body, peer)
+                        if inspect.isawaitable(status):
+                            status = await status
+                    except Exception as e:
+                        error(f"IO HANDLER: {method} {target} {e}")
+                        status = 500
+
+                status = status or 200
+
+                close = headers.get('connection', '').lower() == 'close' or version == 'HTTP/1.0'
+                writer.write(f"HTTP/1.1 {status} {REASON.get(status, '')}\r\nContent-Length: 0\r\n"
+                             f"{'Connection: close' if close else 'Connection: keep-alive'}\r\n\r\n".encode('latin-1'))
+                await writer.drain()
+
+                if close:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError) as e:
+            debug(f"IO CONNECTION: {e}")
+        finally:
+            writer.close()
+
+    srv = await asyncio.start_server(connection, host or None, port)
+    async with srv:
+        await srv.serve_forever()
+
+
+def run(path, handler, port, host=''):
+    asyncio.run(serve(path, handler, port, host))
+
+
+# CLIENT - ONE PERSISTENT CONNECTION TO THE BOARD, OPENED ON FIRST USE AND REOPENED IF IT DROPS
+def client(url):
+
+    u = urlsplit(url)
+    return { 'host': u.hostname, 'port': u.port or 80, 'reader': None, 'writer': None, 'lock': None }
+
+
+async def request(conn, method, target, body=None):
+
+    if conn['lock'] == None:
+        conn['lock'] = asyncio.Lock()
+
+    async with conn['lock']:
+        for attempt in range(2):
+            try:
+                if conn['writer'] == None:
+                    conn['reader'], conn['writer'] = await asyncio.open_connection(conn['host'], conn['port'])
+
+                req = f"{method} {target} HTTP/1.1\r\nHost: {conn['host']}\r\n"
+                if body != None:
+                    req += f"Content-Length: {len(body)}\r\n"
+                conn['writer'].write(req.encode('latin-1') + b'\r\n')
+                if body:
+                    conn['writer'].write(body)
+                await conn['writer'].drain()
+
+                status = int((await conn['reader'].readline()).split()[1])
+                headers = await read_headers(conn['reader'])
+                close = headers.get('connection', '').lower() == 'close'
+                data = await read_body(conn['reader'], headers, eof=close)
+
+                if close:
+                    conn['writer'].close()
+                    conn['writer'] = None
+
+                return (status, data)
+
+            except (asyncio.IncompleteReadError, ConnectionError, IndexError, ValueError) as e:
+                # A KEPT-ALIVE CONNECTION THE BOARD HAS DROPPED IS RETRIED ONCE ON A NEW ONE
+                warning(f"DMA CONNECTION: {method} {target} {e}")
+                if conn['writer'] != None:
+                    conn['writer'].close()
+                conn['writer'] = None
+                if attempt:
+                    raise
+
+
+async def get(conn, target):
+    return await request(conn, 'GET', target)
+
+
+async def put(conn, target, data):
+    return await request(conn, 'PUT', target, bytes(data))
@@ -12,12 +12,22 @@
 #   dependencies:
 #       python3
 #       requests (module)           - to install, use: pip install requests
-#       simple_http_server (module) - to install, use: pip install simple_http_server
+#       iosrv.py                    - the IO callback endpoint, alongside this file
 #       fpdf2 (module)              - to install, use: pip install fpdf2
 #
+#   options:
+#       -P [blue|green|white]       - print to PDF, optionally on coloured computer paper
+#       --file name                 - the output file name without extension (print)
+#       --landscape                 - start in landscape (132 col) orientation
+#       --headless                  - run without the curses UI eg. as a systemd service,
+#                                     status goes to stdout and lpt.log,
+#                                     SIGHUP does a FORMFEED/EJECT, SIGTERM shuts down
+#       --host url                  - the IMSAI8080esp to register with (http://imsai8080)
+#       --port port                 - the port to listen on (3246)
+#       --config file               - a JSON file of the above eg. { "headless": true, "mode": "pdf", "stock": "green" }
+#
 #   TODO:
 #       - add US paper sizes
-#       - make mode selection a command line arg or a key switched mode
 #
 #   known issues:
 #       - TBD
@@ -32,14 +42,15 @@ import curses.textpad
 import sys
 import os
 import socket
-from simple_http_server import route, server, Response, BytesBody, logger as httpdlog
-from threading import Thread
+import iosrv
+from threading import Thread, RLock, Event
 from logging import debug, info, error, warning
 import logging
+import json
+import time
+import signal
 from fpdf import FPDF
 
-httpdlog.set_level("ERROR")
-
 srv = os.path.splitext(os.path.basename(sys.argv[0]))[0]
 
 LPT_PORT = 0xF6
@@ -49,10 +60,16 @@ SRV_PATH = srv
 hosturl = 'http://imsai8080'
 _srvurl = f'http://{socket.gethostname()}:{SRV_PORT}/{SRV_PATH}'
 
-sess = requests.Session()
-
 TMAX = 77
 win = None
+headless = False
+RED = GREEN = YELLOW = CYAN = 0
+
+# DISPLAY STATE - lpt_out ONLY COUNTS PAYLOADS, THE RENDER THREAD REDRAWS AT FPS
+FPS = 20
+ui_lock = RLock()
+ui = { 'busy': False, 'recvs': 0 }
+ui_shown = { 'recvs': 0 }
 
 mode = 'txt'
 file = "print"
@@ -64,6 +81,132 @@ paper = ""
 stock = ""
 stocks = [ 'blue', 'green', 'white' ]
 
+def parse_args():
+
+    global headless, hosturl, SRV_PORT, _srvurl
+    global mode, file, orientation, stock
+
+    args = sys.argv[1:]
+    info(f"Args: {args} [{len(args)}]")
+
+    opts = { }
+
+    if "--config" in args:
+        i = args.index("--config")
+        if len(args) > i + 1:
+            try:
+                with open(args[i+1], "r") as fp:
+                    opts = json.load(fp)
+                info(f"CONFIG: {args[i+1]} {opts}")
+            except (json.decoder.JSONDecodeError, FileNotFoundError) as e:
+                sys.exit(f'FAILED to load config {args[i+1]}: {e}')
+
+    for o in [ 'host', 'port', 'file' ]:
+        if f"--{o}" in args:
+            i = args.index(f"--{o}")
+            if len(args) > i + 1:
+                opts[o] = args[i+1]
+
+    if "--headless" in args:
+        opts['headless'] = True
+
+    if "--landscape" in args:
+        opts['orientation'] = "LANDSCPE"
+
+    if "-P" in args:
+        opts['mode'] = 'pdf'
+        i = args.index("-P")
+        if len(args) > i + 1:
+            if args[i+1] in stocks:
+                opts['stock'] = args[i+1]
+
+    headless = bool(opts.get('headless', headless))
+    hosturl = opts.get('host', hosturl)
+    SRV_PORT = int(opts.get('port', SRV_PORT))
+    _srvurl = f'http://{socket.gethostname()}:{SRV_PORT}/{SRV_PATH}'
+
+    mode = opts.get('mode', mode)
+    file = opts.get('file', file)
+    orientation = "LANDSCPE" if opts.get('orientation', orientation)[0] == 'L' else "PORTRAIT"
+    stock = opts.get('stock', stock)
+
+    if mode == 'pdf':
+        info(f"PDF: selected")
+    if stock in stocks:
+        info(f"Paper color: {stock} selected")
+
+
+def status(msg):
+    info(msg)
+    if headless:
+        print(msg, flush=True)
+
+
+def setup_output():
+
+    global pdf, tf, paper
+
+    if mode == 'pdf':
+        pdf = FPDF()
+        # pdf.add_font(family='Menlo', fname='/Volumes/Macintosh HD/System/Library/Fonts/Menlo.ttc')
+        # pdf.set_font('Menlo')
+        if stock in stocks:
+            paper = f"{'letter' if orientation[0]=='P' else 'wide'}_{stock}"
+            pdf.set_page_background('paper/' + paper + '.svg')
+    else:
+        tf = open(file + '.txt', "w")
+        tf.close()
+
+
+def form_feed():
+
+    global pdf, tf, paper
+    global line, lines, pages
+
+    if line > 0:
+        if mode == 'pdf':
+            if len(linebuf) > 0:
+                pdf.cell(txt="".join(linebuf[0:lineLength]))
+            pdf.output(file + '.pdf')
+            pdf = FPDF()
+            if stock in stocks:
+                paper = f"{'letter' if orientation[0]=='P' else 'wide'}_{stock}"
+                pdf.set_page_background('paper/' + paper + '.svg')
+        else:
+            if len(linebuf) > 0:
+                tf = open(file + '.txt', "a")
+                tf.write("".join(linebuf))
+                tf.close()
+        line = 0
+
+        lines = 0
+        pages = 0
+
+
+def daemon():
+
+    eject = Event()
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    if hasattr(signal, 'SIGHUP'):
+        signal.signal(signal.SIGHUP, lambda signum, frame: eject.set())
+
+    status(f"Remote IMSAI LPT - {srv} (headless)")
+    status(f"Mode: {mode.upper()}  File: {file + '.' + mode}  Orientation: {orientation}")
+
+    setup_output()
+
+    connect_to_host()
+
+    th = Thread(target=iosrv.run, args=(f'/{SRV_PATH}', io_out, SRV_PORT), daemon=True)
+    th.start()
+
+    while True:
+        if eject.wait(1.0):
+            eject.clear()
+            status(f"FORMFEED/EJECT: {file + '.' + mode} pages={pages} lines={lines}")
+            form_feed()
+
+
 def main(sc):
 
     curses.init_pair(1, curses.COLOR_RED, curses.COLOR_BLACK)
@@ -93,136 +236,100 @@ def main(sc):
     connect_to_host()
 
     ## DONT RUN THIS IN A VM OR THE HOST CAN'T BE SEEN
-    th = Thread(target=server.start, args=("", SRV_PORT), daemon=True)
+    th = Thread(target=iosrv.run, args=(f'/{SRV_PATH}', io_out, SRV_PORT), daemon=True)
     th.start()
 
-    global pdf, tf
-    global mode, file, orientation
-    global line, lines, pages
-    global paper, stock
+    rt = Thread(target=render, daemon=True)
+    rt.start()
 
-    args = sys.argv[1:]
-    info(f"Args: {args} [{len(args)}]")
+    global file, orientation
 
-    if "-P" in args:
-        mode = 'pdf'
-        i = args.index("-P")
-        info(f"PDF: selected")
-        if len(args) > i + 1:
-            if args[i+1] in stocks:
-                stock = args[i+1]
-                info(f"Paper color: {stock} selected")
-
-    if mode == 'pdf':
-        pdf = FPDF()
-        # pdf.add_font(family='Menlo', fname='/Volumes/Macintosh HD/System/Library/Fonts/Menlo.ttc')
-        # pdf.set_font('Menlo')
-        if stock in stocks:
-            paper = f"{'letter' if orientation[0]=='P' else 'wide'}_{stock}"
-            pdf.set_page_background('paper/' + paper + '.svg')
-    else:
-        tf = open(file + '.txt', "w")
-        tf.close()
+    setup_output()
 
     while True:
         key = win.getkey()
-        win.addstr(curses.LINES - 3, 1, f"KEY: <{key}>", CYAN)
-        win.clrtoeol()
-        win.refresh()
-
-        # info(f"KEY: {key} len={len(key)} ord={ord(key)}")
-        if key == chr(24): # ^X
-            connect_to_host()
-        if key == chr(4): # ^D
-            # ORIENTATION
-            if orientation == "PORTRAIT":
-                orientation = "LANDSCPE"
-            else:
-                orientation = "PORTRAIT"
-            win.addstr(curses.LINES - 3, 12, f"{orientation}", GREEN)
-        if key == chr(16): # ^P
-            # PORTRAIT
-            orientation = "PORTRAIT"
-            win.addstr(curses.LINES - 3, 12, f"{orientation}", GREEN)
-        if key == chr(12): # ^L
-            # LANDSCAPE
-            orientation = "LANDSCPE"
-            win.addstr(curses.LINES - 3, 12, f"{orientation}", GREEN)
-        if key == chr(6): # ^F
-            # EJECT
-            win.addstr(curses.LINES - 3, 12, f"FORMFEED/EJECT", YELLOW)
-            if line > 0:
-                if mode == 'pdf':
-                    if len(linebuf) > 0:
-                        pdf.cell(txt="".join(linebuf[0:lineLength]))
-                    pdf.output(file + '.pdf')
-                    pdf = FPDF()
-                    if stock in stocks:
-                        paper = f"{'letter' if orientation[0]=='P' else 'wide'}_{stock}"
-                        pdf.set_page_background('paper/' + paper + '.svg')
-                else:
-                    if len(linebuf) > 0:
-                        tf = open(file + '.txt', "a")
-                        tf.write("".join(linebuf))
-                        tf.close()
-                line = 0
-
-                lines = 0
-                pages = 0
-        elif key == chr(14): # ^N
-            #CHANGE FILE
-            # PROMPT USER FOR FILE NAME USING TEXTBOX
-            win.addstr(curses.LINES - 3, 0, f"{mode.upper()} FILE NAME = ")
+
+        with ui_lock:
+            win.addstr(curses.LINES - 3, 1, f"KEY: <{key}>", CYAN)
             win.clrtoeol()
             win.refresh()
-            curses.curs_set(1)
-            txtwin = curses.newwin(1 , TMAX - 34 , curses.LINES - 2, 17)
-            tb = curses.textpad.Textbox(txtwin, insert_mode=True)
-            txt = tb.edit()
-            curses.curs_set(0)
-            txt = txt.strip()
-            info(f"CHANGE {mode.upper()} FILE NAME TO {txt}")
-            file = txt
-
-
-@route(f'/{SRV_PATH}', method="PUT")
-def io_out(p, b=BytesBody()):
-    port = int(p, 16)
-    data = bytearray(b)
+
+            # info(f"KEY: {key} len={len(key)} ord={ord(key)}")
+            if key == chr(24): # ^X
+                connect_to_host()
+            if key == chr(4): # ^D
+                # ORIENTATION
+                if orientation == "PORTRAIT":
+                    orientation = "LANDSCPE"
+                else:
+                    orientation = "PORTRAIT"
+                win.addstr(curses.LINES - 3, 12, f"{orientation}", GREEN)
+            if key == chr(16): # ^P
+                # PORTRAIT
+                orientation = "PORTRAIT"
+                win.addstr(curses.LINES - 3, 12, f"{orientation}", GREEN)
+            if key == chr(12): # ^L
+                # LANDSCAPE
+                orientation = "LANDSCPE"
+                win.addstr(curses.LINES - 3, 12, f"{orientation}", GREEN)
+            if key == chr(6): # ^F
+                # EJECT
+                win.addstr(curses.LINES - 3, 12, f"FORMFEED/EJECT", YELLOW)
+                form_feed()
+            elif key == chr(14): # ^N
+                #CHANGE FILE
+                # PROMPT USER FOR FILE NAME USING TEXTBOX
+                win.addstr(curses.LINES - 3, 0, f"{mode.upper()} FILE NAME = ")
+                win.clrtoeol()
+                win.refresh()
+                curses.curs_set(1)
+                txtwin = curses.newwin(1 , TMAX - 34 , curses.LINES - 2, 17)
+                tb = curses.textpad.Textbox(txtwin, insert_mode=True)
+                txt = tb.edit()
+                curses.curs_set(0)
+                txt = txt.strip()
+                info(f"CHANGE {mode.upper()} FILE NAME TO {txt}")
+                file = txt
+
+
+def io_out(method, port, body, peer):
+    data = bytearray(body)
     debug(f'{port:02X} {len(data):02X} {data}')
 
     if port == LPT_PORT:
         t = lpt_out(data)
 
         if t == 1:
-            return Response(status_code=201)
-    return #normal 200 response 
+            return 201
+    return 200
 
 def connect_to_host():
 
     try:
         sys_get = requests.delete(f'{hosturl}/io?p={LPT_PORT:02X}')
         if sys_get.status_code == 200:
-            info(f'De-registered on {sys_get.text}')
-            win.addnstr(0, 0, f'De-registered on {sys_get.text}', TMAX)
+            status(f'De-registered on {sys_get.text}')
+            if not headless:
+                win.addnstr(0, 0, f'De-registered on {sys_get.text}', TMAX)
 
         sys_get = requests.patch(f'{hosturl}/io?p=-{LPT_PORT:02X}&b=0xFF&t=0x0A', data=_srvurl)
         if sys_get.status_code == 200:
-            info(f'Listening and registered on Port {LPT_PORT:02X}h to {sys_get.text}')
-            win.addnstr(0, 0, f'Listening and registered on Port {LPT_PORT:02X}h to {sys_get.text}', TMAX, GREEN)
-            win.refresh()
+            status(f'Listening and registered on Port {LPT_PORT:02X}h to {sys_get.text}')
+            if not headless:
+                win.addnstr(0, 0, f'Listening and registered on Port {LPT_PORT:02X}h to {sys_get.text}', TMAX, GREEN)
+                win.refresh()
     except:
-        win.addnstr(0, 0, f"*** FAILED to find {hosturl} - not connected", TMAX, RED)
-        win.getkey()
+        if not headless:
+            win.addnstr(0, 0, f"*** FAILED to find {hosturl} - not connected", TMAX, RED)
+            win.getkey()
         sys.exit(f"FAILED to find {hosturl} - not connected")
 
 def lpt_out(data):
 
     res = 0
 
-    win.addstr(1, 0, 'RECV', curses.A_REVERSE + RED)
-    win.clrtoeol()
-    win.refresh()
+    ui['busy'] = True
+    ui['recvs'] += 1
 
     for d in data:
         ch = chr(d)
@@ -231,12 +338,23 @@ def lpt_out(data):
         else:
             textPrint(ch)
 
-    updateStats()
-
-    win.addstr(1, 0, '    ')
-    win.refresh()
+    ui['busy'] = False
     return res
 
+# RENDER THREAD - KEEP RECV LIT FOR A FRAME IF ANY PAYLOAD ARRIVED AND REFRESH THE STATS
+def render():
+    while True:
+        time.sleep(1 / FPS)
+        with ui_lock:
+            if ui['busy'] or ui['recvs'] != ui_shown['recvs']:
+                ui_shown['recvs'] = ui['recvs']
+                win.addstr(1, 0, 'RECV', curses.A_REVERSE + RED)
+                win.clrtoeol()
+                updateStats()
+            else:
+                win.addstr(1, 0, '    ')
+            win.refresh()
+
 def updateStats():
 
     win.addstr(2, 0, f"Mode: {mode.upper()}  File: {file + '.' + mode}")
@@ -350,11 +468,14 @@ def textPrint(ch):
 if __name__ == "__main__":
     try:
         logging.basicConfig(filename="lpt.log", filemode="w", level=logging.INFO)
-        curses.wrapper(main)
+        parse_args()
+        if headless:
+            daemon()
+        else:
+            curses.wrapper(main)
     except KeyboardInterrupt:
         logging.root.setLevel(logging.INFO)
         debug("KEY INT")
-        sess.close()
         if mode == 'pdf':
             if len(linebuf) > 0:
                 pdf.cell(txt="".join(linebuf[0:lineLength]))
@@ -7,8 +7,19 @@
 #   a utility to pack a CP/M (2.2) disk image file (*.dsk) from directories  
 #   on the local file system
 #
+#   usage:
+#       python3 pack.py <image> [--from-tar|--from-zip <archive>|-] [--update [--verify]]
+#
+#       --update        - repack an existing image in place, writing only the files that
+#                         were added, changed or deleted (a new image is packed in full)
+#       --verify        - with --update, compare every file's content not just newer ones
+#       --from-tar      - pack from a tar (optionally compressed) of the .unpacked tree, - for stdin
+#       --from-zip      - pack from a zip of the .unpacked tree, - for stdin
+#
 #   dependencies:
 #       python3
+#       cpmdir.py                   - the CP/M directory engine, alongside this file
+#       geometry.py                 - the disk formats and their translation tables, alongside this file
 #
 #   TODO:
 #
@@ -22,9 +33,15 @@
 # import requests
 import sys
 import os
+import io
+import mmap
+import tarfile
+import zipfile
 from stat import *
 from logging import debug, info, error, warning
 import logging
+from cpmdir import parseDir
+import geometry
 
 
 DEL_BYTE = 0xE5
@@ -32,78 +49,6 @@ EOF_BYTE = 0x1A
 EXT_SZ = 32
 SEC_SZ = 128
 
-trans8 = [ 1,7,13,19,25,5,11,17,23,3,9,15,21,2,8,14,20,26,6,12,18,24,4,10,16,22 ]
-
-dpb8 = { 
-    'sectors': 26,
-    'blksize': 1024,
-    'dirsize': 64,
-    'disksize': 243,
-    'offset': 2,
-    'tracks': 77
-}
-
-dpbHD = { 
-    'sectors': 128,
-    'blksize': 2048,
-    'dirsize': 1024,
-    'disksize': 2040,
-    'offset': 0,
-    'tracks': 255
-}
-
-
-# PARSE DIRECTORY EXTENTS INTO dir ARRAY OF DICTIONARIES ie. USER:FILE.EXT
-def parseDir(dirData, blkMode):
-
-    dir = [ {} for _ in range(16) ]
-
-    for d in range(len(dirData) // EXT_SZ):
-
-        dirExt = dirData[ d * EXT_SZ : (d + 1) * EXT_SZ ]
-
-        user = dirExt[ 0 ]
-        filename = ''
-        for f in range(8):
-            filename += chr(dirExt[ 1 + f ])
-
-        filename += '.'
-        for e in range(3):
-            filename += chr(dirExt[ 9 + e ])
-
-        xl = dirExt[ 12 ]
-        bc = dirExt[ 13 ]
-        xh = dirExt[ 14 ]
-        rc = dirExt[ 15 ]
-
-        blkcount = 0
-        if blkMode:
-            blocks = []
-            for b in range(0, 16, 2):
-                bp = dirExt[ 16 + b ] | (dirExt[ 17 + b ] << 8)
-                if bp:
-                    blkcount += 1
-                blocks.append(bp)
-        else:
-            blocks = dirExt[ 16 : 32 ]
-            for a in range(16):
-                if dirExt[ 16 + a ]:
-                    blkcount += 1
-
-        # print(f'Entry: {d:02} User: {user:02X} Filename: {filename} Ext(xl:xh): {xl:02X}:{xh:02X} Len(bc:rc): {bc}:{rc} Bps: {list(blocks)}')
-
-        if user != DEL_BYTE:
-            # print(f'Entry: {d:02} User: {user:02X} Filename: {filename} Ext(xl:xh): {xl:02X}:{xh:02X} Len(bc:rc): {bc}:{rc} Bps: {list(blocks)}')
-
-            if dir[user].get(filename) == None:
-                dir[user][filename] = { 'blocks': 0, "recs": 0, "data": [] }
-            
-            dir[user][filename]['blocks'] += blkcount
-            dir[user][filename]['recs'] += rc
-            dir[user][filename]['data'].extend(blocks)
-    return dir
-
-
 # PRINT DIRECTORY
 def printDir(dir, blksize):
     for u in range(16):
@@ -114,25 +59,94 @@ def printDir(dir, blksize):
             print('Name         Bytes   Recs')
             print('------------ ------ ------')
             for f in dir[u]:
-                size = dir[u][f]['blocks']*(blksize//1024)
-                print(f"{f} {size:5}K {dir[u][f]['recs']:5}")
+                size = dir[u][f].blocks*(blksize//1024)
+                print(f"{f} {size:5}K {dir[u][f].recs:5}")
 
 
-# FORMAT AN EMPTY DISK IMAGE
-def formatImage(name, dpb):
+class Entry:
+    """A file or directory of an archive, with what build_directory uses of an os.DirEntry"""
+    __slots__ = ('name', 'st_size', 'st_mode')
 
-    try:
-        disk = open(name, 'xb')
-    except FileExistsError:
-        sys.exit(f"FAILED to open {name} - file exists")
+    def __init__(self, name, size, mode):
+        self.name = name
+        self.st_size = size
+        self.st_mode = mode
 
-    sec = [ DEL_BYTE ] * SEC_SZ
+    def stat(self):
+        return self
 
-    for s in range(dpb['sectors'] * dpb['tracks']):
-        disk.seek(s * SEC_SZ)
-        disk.write(bytearray(sec))
 
-    disk.close()
+class Archive:
+    """An .unpacked tree read from a tar or zip archive (or stream) in place of the file system
+
+    member names are as in the tree, ie. $BOOT and <user>/<file>, optionally under a
+    top level <name>.unpacked/ directory
+    """
+
+    def __init__(self, name, kind):
+
+        src = sys.stdin.buffer if name == '-' else open(name, 'rb')
+
+        self.files = { }
+        self.dirs = { }
+
+        if kind == 'tar':
+            with tarfile.open(fileobj=src, mode='r|*') as tar:
+                for m in tar:
+                    if m.isdir():
+                        self.add(m.name, None)
+                    elif m.isfile():
+                        self.add(m.name, tar.extractfile(m).read())
+        else:
+            # A zip IS READ FROM ITS END, SO A STREAM IS TAKEN IN WHOLE FIRST
+            with zipfile.ZipFile(io.BytesIO(src.read())) as zip:
+                for m in zip.infolist():
+                    self.add(m.filename, None if m.is_dir() else zip.read(m))
+
+        if src != sys.stdin.buffer:
+            src.close()
+
+    def add(self, name, data):
+        path = [ p for p in name.split('/') if p not in ('', '.') ]
+        if len(path) and path[0].endswith('.unpacked'):
+            path = path[1:]
+        if len(path) == 0:
+            return
+
+        for d in range(1, len(path) if data != None else len(path) + 1):
+            self.dirs['/'.join(path[:d])] = True
+        if data != None:
+            self.files['/'.join(path)] = data
+
+    def scandir(self, path=''):
+        prefix = path + '/' if path else ''
+        for d in self.dirs:
+            if d.startswith(prefix) and '/' not in d[len(prefix):]:
+                yield Entry(d[len(prefix):], 0, S_IFDIR | 0o755)
+        for (f, data) in self.files.items():
+            if f.startswith(prefix) and '/' not in f[len(prefix):]:
+                yield Entry(f[len(prefix):], len(data), S_IFREG | 0o644)
+
+    def rename(self, path, old, new):
+        self.files[f'{path}/{new}'] = self.files.pop(f'{path}/{old}')
+
+    def open(self, path):
+        return io.BytesIO(self.files[path])
+
+
+def openFile(root, archive, *path):
+    if archive:
+        return archive.open('/'.join(path))
+    return open(os.path.join(root, *path), 'rb')
+
+
+# FORMAT AN EMPTY DISK IMAGE - IN MEMORY, IT IS WRITTEN OUT ONCE PACKED
+def formatImage(name, geo, replace=False):
+
+    if not replace and os.path.exists(name):
+        sys.exit(f"FAILED to open {name} - file exists")
+
+    return bytearray([ DEL_BYTE ]) * geo.size
 
 
 def shorten(name, list):
@@ -166,15 +180,13 @@ def shorten(name, list):
     return shortname
 
 
-def build_directory(root, dpb):
+# SCAN THE TREE (OR archive) - RETURNS ( boot, [ (user, FILENAME.EXT, host path, size, mtime) ] )
+def scan_tree(root, archive=None):
 
     boot = False
-    dirdata = [ DEL_BYTE ] * (EXT_SZ * dpb['dirsize'])
+    files = [ ]
 
-    d = os.scandir(root)
-
-    dirI = 0
-    blkN = (EXT_SZ * dpb['dirsize']) // dpb['blksize']
+    d = archive.scandir() if archive else os.scandir(root)
 
     for i in d:
         s = i.stat().st_size
@@ -199,18 +211,22 @@ def build_directory(root, dpb):
 
             info(f"{i.name:12} <DIR> {outcome}")
 
-            files = list(os.scandir(os.path.join(root, i.name)))
-            names = [ f.name for f in files ]
+            entries = list(archive.scandir(i.name) if archive else os.scandir(os.path.join(root, i.name)))
+            names = [ f.name for f in entries ]
 
-            for f in files:
+            for f in entries:
 
                 size = f.stat().st_size
                 mode = f.stat().st_mode
+                mtime = getattr(f.stat(), 'st_mtime', float('inf'))  # AN ARCHIVE MEMBER IS ALWAYS COMPARED
                 name = shorten(f.name, names)
 
                 if name != f.name:
                     try:
-                        os.rename(os.path.join(root, i.name, f.name), os.path.join(root, i.name, name))
+                        if archive:
+                            archive.rename(i.name, f.name, name)
+                        else:
+                            os.rename(os.path.join(root, i.name, f.name), os.path.join(root, i.name, name))
                         warning(f'RENAMED FILE: {f.name} to {name}')
                     except:
                         error(f"FAILED TO RENAME {f.name} to {name}")
@@ -223,90 +239,106 @@ def build_directory(root, dpb):
 
                     info(f"{cpmfile}.{cpmext} {size:6} {size//1024:5} {size//128:5}")
 
-                    ext = [0] * 32
+                    files.append((int(i.name), f'{cpmfile}.{cpmext}', (i.name, name), size, mtime))
+
+    return ( boot, files )
+
 
-                    ext[0] = int(i.name)
+# THE DIRECTORY EXTENTS OF ONE FILE, ITS BLOCKS TAKEN IN TURN FROM alloc()
+def file_extents(user, filename, size, dpb, alloc):
 
-                    ext[1:9] = [ord(c) for c in cpmfile]
-                    ext[9:12] = [ord(c) for c in cpmext]
+    extents = [ ]
 
-                    # XL - extent number bits 0-4
-                    # XH - extent number bits 5-10
-                    xNum = 0
+    ext = [0] * 32
 
-                    # BC - always ZERO for CPM22 - ignore
+    ext[0] = user
 
-                    # RC - number of recs/secs in the extent
-                    # round up if not a full sector (even multiple)
-                    rc = size // SEC_SZ + ( 1 if (size % SEC_SZ) else 0)
+    ext[1:12] = [ord(c) for c in filename.replace('.', '')]
 
-                    while rc >= 0:
-                        nextext = list(ext)
-                        nextext[12] = xNum & 0x1F
-                        # nextext[13] = 0
-                        nextext[14] = xNum >> 5
-                        nextext[15] = rc if rc <= 128 else 128
+    # XL - extent number bits 0-4
+    # XH - extent number bits 5-10
+    xNum = 0
 
-                        ### ADD BLOCK POINTERS HERE
-                        numRec = dpb['blksize'] // SEC_SZ
-                        bc = (nextext[15] // numRec) + (1 if (nextext[15] % numRec) else 0)
+    # BC - always ZERO for CPM22 - ignore
 
-                        for b in range(bc):
-                            if dpb['disksize'] > 255:
-                                nextext[16 + b*2] = blkN & 0xFF
-                                nextext[17 + b*2] = blkN >> 8
-                            else:
-                                nextext[16 + b] = blkN
+    # RC - number of recs/secs in the extent
+    # round up if not a full sector (even multiple)
+    rc = size // SEC_SZ + ( 1 if (size % SEC_SZ) else 0)
 
-                            blkN += 1
+    while rc >= 0:
+        nextext = list(ext)
+        nextext[12] = xNum & 0x1F
+        # nextext[13] = 0
+        nextext[14] = xNum >> 5
+        nextext[15] = rc if rc <= 128 else 128
 
-                        # debug(nextext)
+        ### ADD BLOCK POINTERS HERE
+        numRec = dpb['blksize'] // SEC_SZ
+        bc = (nextext[15] // numRec) + (1 if (nextext[15] % numRec) else 0)
 
-                        for d in range(EXT_SZ):
-                            dirdata[(dirI * EXT_SZ + d)] = nextext[d]
-                        
-                        dirI += 1
+        for b in range(bc):
+            blkN = alloc()
+            if dpb['disksize'] > 255:
+                nextext[16 + b*2] = blkN & 0xFF
+                nextext[17 + b*2] = blkN >> 8
+            else:
+                nextext[16 + b] = blkN
+
+        # debug(nextext)
+
+        extents.append(bytes(nextext))
+
+        xNum += 1
+        rc -= 128
+
+    return extents
+
+
+def build_directory(root, dpb, archive=None):
+
+    dirdata = bytearray([ DEL_BYTE ]) * (EXT_SZ * dpb['dirsize'])
+
+    (boot, files) = scan_tree(root, archive)
 
-                        xNum += 1
-                        rc -= 128
+    dirI = 0
+    blkN = [ (EXT_SZ * dpb['dirsize']) // dpb['blksize'] ]
+
+    def alloc():
+        blkN[0] += 1
+        return blkN[0] - 1
+
+    for (user, filename, path, size, mtime) in files:
+        for e in file_extents(user, filename, size, dpb, alloc):
+            if dirI >= dpb['dirsize']:
+                sys.exit(f"DIRECTORY FULL - {dpb['dirsize']} ENTRIES")
+            dirdata[dirI * EXT_SZ: (dirI + 1) * EXT_SZ] = e
+            dirI += 1
 
-    return ( boot, bytearray(dirdata) )
+    return ( boot, dirdata )
 
 
-def writeImage(name, boot, dirdata, dpb, trans):
+def writeImage(name, image, boot, dirdata, geo, archive=None):
 
     root, ext = os.path.splitext(name)
     root += '.unpacked'
 
-    disk = open(name , 'r+b')
+    dpb = geo.dpb
+    mv = memoryview(image)
 
-    #WRITE BOOT TRACKS
+    #READ BOOT TRACKS
     if boot:
-        bootfile = open(os.path.join(root, '$BOOT'), 'rb');
-        bootdata = bootfile.read(dpb['sectors'] * dpb['offset'] * SEC_SZ)
-        disk.seek(0)
-        disk.write(bootdata)
-        bootfile.close()
-
-    #WRITE DIRECTORY - MUST BE SECTOR BY SECTOR
-    for sd in range((dpb['dirsize'] * EXT_SZ) // SEC_SZ):
-
-        trk = sd // dpb['sectors']
-        sec = sd % dpb['sectors']
-        
-        if trans != 0:
-            tb = trans[sec] - 1
-        else:
-            tb = sec
+        with openFile(root, archive, '$BOOT') as bootfile:
+            bootfile.readinto(mv[0: geo.bootsize])
+
+    #LAY OUT THE DIRECTORY - SECTOR BY SECTOR FOR THE SKEW
+    for sd in range(geo.dirsecs):
 
-        loc = (((dpb['offset'] + trk) * dpb['sectors']) + tb) * SEC_SZ
-        disk.seek(loc)
-        disk.write(bytearray(dirdata[sd * SEC_SZ : (sd+1) * SEC_SZ]))
+        image[geo.pos[sd]: geo.pos[sd] + SEC_SZ] = dirdata[sd * SEC_SZ : (sd+1) * SEC_SZ]
 
-    dir = parseDir(bytearray(dirdata), 1 if dpb['disksize'] > 255 else 0)
+    dir = parseDir(dirdata, 1 if dpb['disksize'] > 255 else 0)
     printDir(dir, dpb['blksize'])
 
-    #WRITE DATABLOCKS - MUST BE SECTOR BY SECTOR
+    #READ DATABLOCKS STRAIGHT INTO PLACE - ONE readinto PER RUN OF CONTIGUOUS SECTORS
     for u in range(16):
         if dir[u] != {}:
             for f in dir[u]:
@@ -315,67 +347,190 @@ def writeImage(name, boot, dirdata, dpb, trans):
                 fn[1] = fn[1].strip()
                 fn = '.'.join(fn)
 
-                file = open(os.path.join(root, f'{u}', fn),'rb')
-                fsec = 0
+                file = openFile(root, archive, f'{u}', fn)
 
-                recs = dir[u][f]['recs']
+                for (pos, n) in geo.runs(dir[u][f].data, dir[u][f].recs):
+                    file.readinto(mv[pos: pos + n])
 
-                for b in dir[u][f]['data']:
-
-                    if b > 0:
-                        numRec = dpb['blksize'] // SEC_SZ
-                        r = numRec if recs > numRec else recs
-                        recs -= r
+                file.close()
 
-                        for s in range(r):
-                            sec = b * numRec + s
-                            trk = sec // dpb['sectors']
-                            sec = sec % dpb['sectors']
-                            
-                            if trans:
-                                tb = trans[sec] - 1
-                            else:
-                                tb = sec
+    mv.release()
 
-                            loc = (((dpb['offset'] + trk) * dpb['sectors']) + tb) * SEC_SZ
-                            disk.seek(loc)
-                            file.seek(fsec * SEC_SZ)
-                            data = file.read(SEC_SZ)
+    #WRITE THE IMAGE IN ONE GO, UNDER A TEMPORARY NAME UNTIL IT IS COMPLETE
+    tmp = name + '.tmp'
+    try:
+        with open(tmp, 'xb') as disk:
+            disk.write(image)
+        os.replace(tmp, name)
+    except FileExistsError:
+        sys.exit(f"FAILED to open {tmp} - file exists")
+    except:
+        os.remove(tmp)
+        raise
 
-                            disk.write(data)
 
-                            fsec += 1
+# PACK <name>.unpacked (OR archive) INTO THE IMAGE <name>, replace TO OVERWRITE AN EXISTING IMAGE
+def pack(name, replace=False, archive=None):
 
-                        # debug(f"File: {f} Block: {b} Trk: {trk:02} Sec: {sec:02} Recs: {recs} Len: {len(data)}")
+    file, ext = os.path.splitext(name)
 
-                file.close()
+    geo = geometry.for_ext(ext)
+    if geo == None:
+        sys.exit(f'UNKNOWN IMAGE TYPE: {ext} FOR FILE {file + ext}')
 
-    disk.close()
+    (boot, dirdata) = build_directory(file + '.unpacked', geo.dpb, archive)
 
+    image = formatImage(file + ext, geo, replace)
 
-def main():
+    writeImage(file + ext, image, boot, dirdata, geo, archive)
 
-    args = sys.argv[1:]
-    print (args)
 
-    file, ext = os.path.splitext(args[0])
+# REPACK AN EXISTING IMAGE IN PLACE FROM <name>.unpacked (OR archive)
+# ONLY THE EXTENTS AND DATA BLOCKS OF ADDED, CHANGED AND DELETED FILES ARE WRITTEN, A FILE IS
+# UNCHANGED IF ITS RECORD COUNT MATCHES AND IT IS OLDER THAN THE IMAGE (OR, IF NOT OR verify,
+# ITS CONTENT MATCHES)
+def update(name, verify=False, archive=None):
 
-    if ext == '.hdd':
-        dpb = dpbHD
-        trans = 0
-    elif ext == '.dsk':
-        dpb = dpb8
-        trans = trans8
+    file, ext = os.path.splitext(name)
 
-    else:
+    geo = geometry.for_ext(ext)
+    if geo == None:
         sys.exit(f'UNKNOWN IMAGE TYPE: {ext} FOR FILE {file + ext}')
-      
 
-    (boot, dirdata) = build_directory(file + '.unpacked', dpb)
+    if not os.path.exists(name):
+        return pack(name, archive=archive)
+
+    root = file + '.unpacked'
+    dpb = geo.dpb
+    blkMode = 1 if dpb['disksize'] > 255 else 0
+
+    (boot, files) = scan_tree(root, archive)
+
+    disk = open(name, 'r+b')
+    since = os.fstat(disk.fileno()).st_mtime
+    if os.fstat(disk.fileno()).st_size != geo.size:
+        sys.exit(f'FAILED to update {name} - not a {geo.name} image')
+
+    mm = mmap.mmap(disk.fileno(), 0)
+    mv = memoryview(mm)
+
+    def entry(d):
+        pos = geo.pos[d * EXT_SZ // SEC_SZ] + (d * EXT_SZ) % SEC_SZ
+        return slice(pos, pos + EXT_SZ)
+
+    dir = parseDir(b''.join([ mv[geo.pos[sd]: geo.pos[sd] + SEC_SZ] for sd in range(geo.dirsecs) ]), blkMode)
+
+    # COMPARE THE TREE WITH THE IMAGE
+    outcome = { }
+    found = set()
+    for (user, filename, path, size, mtime) in files:
+        found.add((user, filename))
+        f = dir[user].get(filename)
+        recs = size // SEC_SZ + ( 1 if (size % SEC_SZ) else 0)
+
+        if f == None:
+            outcome[(user, filename)] = 'ADDED'
+        elif f.recs != recs:
+            outcome[(user, filename)] = 'CHANGED'
+        elif mtime > since or verify:
+            with openFile(root, archive, *path) as host:
+                data = host.read()
+            data += bytes([ DEL_BYTE ]) * (recs * SEC_SZ - len(data))
+            if data != b''.join([ mv[pos: pos + n] for (pos, n) in geo.runs(f.data, f.recs) ]):
+                outcome[(user, filename)] = 'CHANGED'
+
+    for user in range(16):
+        for filename in dir[user]:
+            if (user, filename) not in found:
+                outcome[(user, filename)] = 'DELETED'
+
+    # FREE THE EXTENTS AND BLOCKS OF CHANGED AND DELETED FILES
+    dirblocks = (EXT_SZ * dpb['dirsize']) // dpb['blksize']
+    used = set(dir.alloc[d * dir.ptrs + p] for d in range(dpb['dirsize']) if dir.user[d] != DEL_BYTE for p in range(dir.ptrs))
+    slots = [ ]
+    for (user, filename) in outcome:
+        if outcome[(user, filename)] != 'ADDED':
+            f = dir[user][filename]
+            used.difference_update(f.data)
+            slots.extend(f.exts)
+
+    # PLAN THE NEW EXTENTS BEFORE ANYTHING IS WRITTEN, SO A FULL DISK LEAVES THE IMAGE AS IT WAS
+    slots = sorted(slots + [ d for d in range(dpb['dirsize']) if dir.user[d] == DEL_BYTE ], reverse=True)
+    free = sorted(set(range(dirblocks, dpb['disksize'])) - used, reverse=True)
+
+    def alloc():
+        if len(free) == 0:
+            sys.exit(f'FAILED to update {name} - disk full')
+        return free.pop()
+
+    plan = [ ]
+    for (user, filename, path, size, mtime) in files:
+        if outcome.get((user, filename), 'DELETED') != 'DELETED':
+            blocks = [ ]
+            def take():
+                blocks.append(alloc())
+                return blocks[-1]
+            extents = file_extents(user, filename, size, dpb, take)
+            if len(extents) > len(slots):
+                sys.exit(f'FAILED to update {name} - directory full')
+            plan.append((path, size, blocks, [ (slots.pop(), e) for e in extents ]))
+
+    # WRITE ONLY WHAT HAS CHANGED
+    if boot:
+        with openFile(root, archive, '$BOOT') as bootfile:
+            data = bootfile.read(geo.bootsize)
+        if mv[0: len(data)] != data:
+            mv[0: len(data)] = data
+
+    for (user, filename) in outcome:
+        if outcome[(user, filename)] != 'ADDED':
+            for d in dir[user][filename].exts:
+                mv[entry(d)] = bytes([ DEL_BYTE ]) * EXT_SZ
+
+    for (path, size, blocks, extents) in plan:
+        for (pos, n) in geo.runs(blocks, len(blocks) * geo.recs):
+            mv[pos: pos + n] = bytes([ DEL_BYTE ]) * n
+        with openFile(root, archive, *path) as host:
+            for (pos, n) in geo.runs(blocks, size // SEC_SZ + ( 1 if (size % SEC_SZ) else 0)):
+                host.readinto(mv[pos: pos + n])
+        for (d, e) in extents:
+            mv[entry(d)] = e
+
+    dir = parseDir(b''.join([ mv[geo.pos[sd]: geo.pos[sd] + SEC_SZ] for sd in range(geo.dirsecs) ]), blkMode)
+    printDir(dir, dpb['blksize'])
+
+    mv.release()
+    mm.flush()
+    mm.close()
+    disk.close()
+
+    print()
+    for ((user, filename), what) in outcome.items():
+        print(f'{what:8} {user:2}:{filename}')
+    count = { w: list(outcome.values()).count(w) for w in ('ADDED', 'CHANGED', 'DELETED') }
+    print(f"{len(files) - count['ADDED'] - count['CHANGED']} UNCHANGED, " + ', '.join(f'{count[w]} {w}' for w in count))
 
-    formatImage(file + ext, dpb)
 
-    writeImage(file + ext, boot, dirdata, dpb, trans)
+def main():
+
+    args = sys.argv[1:]
+    print (args)
+
+    archive = None
+    for (opt, kind) in (('--from-tar', 'tar'), ('--from-zip', 'zip')):
+        if opt in args:
+            i = args.index(opt)
+            if i + 1 >= len(args):
+                sys.exit(f'{opt} needs an archive name or - for stdin')
+            archive = Archive(args[i + 1], kind)
+            del args[i: i + 2]
+
+    if '--update' in args:
+        verify = '--verify' in args
+        args = [ a for a in args if a not in ('--update', '--verify') ]
+        update(args[0], verify, archive)
+    else:
+        pack(args[0], archive=archive)
 
 
 if __name__ == "__main__":
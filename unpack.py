@@ -7,8 +7,17 @@
 #   a utility to unpack a CP/M (2.2) disk image files (*.dsk) directories  
 #   on the local file system
 #
+#   usage:
+#       python3 unpack.py <image> [--trim] [--to-tar|--to-zip <archive>|-]
+#
+#       --trim          - cut each file at the ^Z in its last record (for text files)
+#       --to-tar        - stream the files into a tar archive instead of a tree, - for stdout
+#       --to-zip        - stream the files into a zip archive instead of a tree, - for stdout
+#
 #   dependencies:
 #       python3
+#       cpmdir.py                   - the CP/M directory engine, alongside this file
+#       geometry.py                 - the disk formats and their translation tables, alongside this file
 #
 #   TODO:
 #
@@ -21,8 +30,15 @@
 
 import sys
 import os
-from logging import debug, info, error, warning
+from logging import debug, info, error
 import logging
+import mmap
+import io
+import time
+import tarfile
+import zipfile
+from cpmdir import parseDir, hostFilename
+import geometry
 
 
 DEL_BYTE = 0xE5
@@ -30,79 +46,6 @@ EOF_BYTE = 0x1A
 EXT_SZ = 32
 SEC_SZ = 128
 
-trans8 = [ 1,7,13,19,25,5,11,17,23,3,9,15,21,2,8,14,20,26,6,12,18,24,4,10,16,22 ]
-
-dpb8 = { 
-    'sectors': 26,
-    'blksize': 1024,
-    'dirsize': 64,
-    'disksize': 243,
-    'offset': 2,
-    'tracks': 77
-}
-
-dpbHD = { 
-    'sectors': 128,
-    'blksize': 2048,
-    'dirsize': 1024,
-    'disksize': 2040,
-    'offset': 0,
-    'tracks': 255
-}
-
-
-# PARSE DIRECTORY EXTENTS INTO dir ARRAY OF DICTIONARIES ie. USER:FILE.EXT
-def parseDir(dirData, blkMode):
-
-    dir = [ {} for _ in range(16) ]
-
-    for d in range(len(dirData) // EXT_SZ):
-
-        dirExt = dirData[ d * EXT_SZ : (d + 1) * EXT_SZ ]
-
-        user = dirExt[ 0 ]
-        filename = ''
-        for f in range(8):
-            filename += chr(dirExt[ 1 + f ])
-
-        filename += '.'
-        for e in range(3):
-            filename += chr(dirExt[ 9 + e ])
-
-        xl = dirExt[ 12 ]
-        bc = dirExt[ 13 ]
-        xh = dirExt[ 14 ]
-        rc = dirExt[ 15 ]
-
-        blkcount = 0
-        if blkMode:
-            blocks = []
-            for b in range(0, 16, 2):
-                bp = dirExt[ 16 + b ] | (dirExt[ 17 + b ] << 8)
-                if bp:
-                    blkcount += 1
-                blocks.append(bp)
-        else:
-            blocks = dirExt[ 16 : 32 ]
-            for a in range(16):
-                if dirExt[ 16 + a ]:
-                    blkcount += 1
-
-        if user != DEL_BYTE and user <= 0x0F:
-            # info(f'Entry: {d:02} User: {user:02X} Filename: {filename} Ext(xl:xh): {xl:02X}:{xh:02X} Len(bc:rc): {bc}:{rc} Bps: {list(blocks)}')
-
-            if dir[user].get(filename) == None:
-                dir[user][filename] = { 'blocks': 0, "recs": 0, "data": [] }
-            
-            dir[user][filename]['blocks'] += blkcount
-            dir[user][filename]['recs'] += rc
-            dir[user][filename]['data'].extend(blocks)
-        elif user != DEL_BYTE:
-            warning(f'***UNKNOWN Entry: {d:02} User: {user:02X} Filename: {filename} Ext(xl:xh): {xl:02X}:{xh:02X} Len(bc:rc): {bc}:{rc} Bps: {list(blocks)}')
-
-    return dir
-
-
 # PRINT DIRECTORY
 def printDir(dir, blksize):
     for u in range(16):
@@ -113,108 +56,160 @@ def printDir(dir, blksize):
             print('Name         Bytes   Recs')
             print('------------ ------ ------')
             for f in dir[u]:
-                size = dir[u][f]['blocks']*(blksize//1024)
-                print(f"{f} {size:5}K {dir[u][f]['recs']:5}")
+                size = dir[u][f].blocks*(blksize//1024)
+                print(f"{f} {size:5}K {dir[u][f].recs:5}")
 
-def main():
+# GATHER A FILE'S RECORDS FROM THE MAPPED IMAGE - ONE SLICE PER RUN OF CONTIGUOUS SECTORS
+def fileData(mv, geo, f, trim=False):
 
-    args = sys.argv[1:]
-    print (args)
+    data = b''.join([ mv[pos: pos + n] for (pos, n) in geo.runs(f.data, f.recs) ])
 
-    try:
-        image = open(args[0] + '.dsk', "rb")
+    # A TEXT FILE ENDS AT THE FIRST ^Z IN ITS LAST RECORD, THE REST IS PADDING
+    if trim and len(data) > 0:
+        eof = data.find(EOF_BYTE, len(data) - SEC_SZ)
+        if eof >= 0:
+            data = data[:eof]
+
+    return data
+
+# THE UNPACKED FILES GO TO A TREE ON THE LOCAL FILE SYSTEM, OR INTO A tar OR zip ARCHIVE
+class Tree:
+    def __init__(self, root):
+        self.root = root
+        try:
+            os.mkdir(root)
+        except FileExistsError:
+            sys.exit(f'FAILED to create {root} - directory already exists')
+
+    def mkdir(self, path):
+        os.mkdir(os.path.join(self.root, path))
+
+    def write(self, path, data):
+        with open(os.path.join(self.root, path), 'wb') as file:
+            file.write(data)
+
+    def close(self):
+        pass
+
+class TarOut:
+    def __init__(self, name, mtime):
+        self.mtime = mtime
+        self.tar = tarfile.open(name if name != '-' else None, mode='w|', fileobj=sys.__stdout__.buffer if name == '-' else None)
+
+    def mkdir(self, path):
+        info = tarfile.TarInfo(path)
+        info.type = tarfile.DIRTYPE
+        info.mode = 0o755
+        info.mtime = self.mtime
+        self.tar.addfile(info)
+
+    def write(self, path, data):
+        info = tarfile.TarInfo(path)
+        info.size = len(data)
+        info.mode = 0o644
+        info.mtime = self.mtime
+        self.tar.addfile(info, io.BytesIO(data))
+
+    def close(self):
+        self.tar.close()
 
-        dpb = dpb8
-        trans = trans8
-    except FileNotFoundError:
+class ZipOut:
+    def __init__(self, name, mtime):
+        self.date = time.localtime(max(mtime, 315532800))[:6]   # zip DATES START IN 1980
+        self.zip = zipfile.ZipFile(sys.__stdout__.buffer if name == '-' else name, 'w', zipfile.ZIP_DEFLATED)
+
+    def mkdir(self, path):
+        self.zip.writestr(zipfile.ZipInfo(path + '/', self.date), b'')
+
+    def write(self, path, data):
+        self.zip.writestr(zipfile.ZipInfo(path, self.date), data, zipfile.ZIP_DEFLATED)
+
+    def close(self):
+        self.zip.close()
+
+ARCHIVES = { '--to-tar': TarOut, '--to-zip': ZipOut }
+
+# UNPACK THE IMAGE <name>.dsk|.hdd INTO root (DEFAULT <name>.unpacked)
+# OR, GIVEN archive ('--to-tar'|'--to-zip', <file>|-), INTO AN ARCHIVE OF THE SAME LAYOUT
+def unpack(name, trim=False, root=None, archive=None, ext=None):
+
+    # TRY EACH REGISTERED FORMAT BY ITS IMAGE FILE EXTENSION, OR ONLY ext WHERE THE IMAGE IS KNOWN
+    for ext in [ ext ] if ext else geometry.EXTS:
         try:
-            image = open(args[0] + '.hdd', "rb")
+            image = open(name + ext, "rb")
+
+            geo = geometry.for_ext(ext)
+            dpb = geo.dpb
+            break
+        except FileNotFoundError:
+            pass
+    else:
+        sys.exit(f'DISK IMAGE FILE NOT FOUND for {name}')
 
-            dpb = dpbHD
-            trans = 0
-        except FileNotFoundError as e:
-            sys.exit(f'DISK IMAGE FILE NOT FOUND for {args[0]}')
+    if root == None:
+        root = name + '.unpacked'
 
-    root = args[0] + '.unpacked'
+    # MAP THE IMAGE, SECTORS ARE SLICED FROM THE MAPPING NOT READ
+    mm = mmap.mmap(image.fileno(), 0, access=mmap.ACCESS_READ)
+    mv = memoryview(mm)
 
     if dpb['offset'] > 0:
-        boot = image.read(dpb['offset'] * dpb['sectors'] * SEC_SZ)
+        boot = mv[0: geo.bootsize]
 
         if boot[0] != DEL_BYTE:
             print("$$$BOOT RECORD$$$")
 
-    dirsecs = dpb['dirsize'] * EXT_SZ // SEC_SZ
-    # debug(dirsecs)
-
-    dirData = b''
-
     # READ DIRECTORY SECTORS
-    for b in range( dirsecs ):
-        if trans:
-            tb = trans[b] - 1
-        else:
-            tb = b
-        loc = ((dpb['offset'] * dpb['sectors']) + tb) * SEC_SZ
-        # debug(b, tb, f'{loc:04X}')
-        image.seek(loc)
-        blk = image.read(SEC_SZ)
-        dirData += blk
+    dirData = b''.join([ mv[geo.pos[b]: geo.pos[b] + SEC_SZ] for b in range(geo.dirsecs) ])
 
     dir = parseDir(dirData, 1 if dpb['disksize'] > 255 else 0)
     printDir(dir, dpb['blksize'])
 
-    try:
-        os.mkdir(root)
-    except FileExistsError:
-        sys.exit(f'FAILED to create {root} - directory already exists')
+    if archive:
+        out = ARCHIVES[archive[0]](archive[1], int(os.fstat(image.fileno()).st_mtime))
+    else:
+        out = Tree(root)
 
     if dpb['offset'] > 0 and boot[0] != DEL_BYTE:
-        bf = open(os.path.join(root, '$BOOT'), 'wb')
-        bf.write(boot)
-        bf.close()
+        out.write('$BOOT', boot)
 
     for u in range(16):
         if dir[u] != {}:
-            os.mkdir(os.path.join(root, f'{u}'))
-            if dir[u] != { }:
-                for f in dir[u]:
-                    fn = f.split('.',1)
-                    fn[0] = fn[0].strip()
-                    fn[1] = fn[1].strip()
-                    fn = '.'.join(fn)
-
-                    file = open(os.path.join(root, f'{u}', fn),'ab')
+            out.mkdir(f'{u}')
+            for f in dir[u]:
+                out.write(f'{u}/{hostFilename(f)}', fileData(mv, geo, dir[u][f], trim))
 
-                    recs = dir[u][f]['recs']
+    out.close()
 
-                    for b in dir[u][f]['data']:
+    if dpb['offset'] > 0:
+        boot.release()
+    mv.release()
+    mm.close()
+    image.close()
 
-                        if b > 0:
-                            numRec = dpb['blksize'] // SEC_SZ
-                            r = numRec if recs > numRec else recs
-                            recs -= r
+def main():
 
-                            for s in range(r):
-                                sec = b * numRec + s
-                                trk = sec // dpb['sectors']
-                                sec = sec % dpb['sectors']
-                                
-                                if trans:
-                                    tb = trans[sec] - 1
-                                else:
-                                    tb = sec
+    args = sys.argv[1:]
 
-                                loc = (((dpb['offset'] + trk) * dpb['sectors']) + tb) * SEC_SZ
-                                image.seek(loc)
-                                data = image.read(SEC_SZ)
+    # THE LISTING MUST NOT GET INTO AN ARCHIVE ON stdout
+    if '-' in args:
+        sys.stdout = sys.stderr
 
-                                file.write(data)
+    print (args)
 
-                                # info(f"File: {f} Block: {b} Trk: {trk:02} Sec: {sec:02} Recs: {recs} Len: {len(data)}")
+    trim = '--trim' in args
+    args = [ a for a in args if a != '--trim' ]
 
-                    file.close()
+    archive = None
+    for opt in ARCHIVES:
+        if opt in args:
+            i = args.index(opt)
+            if i + 1 >= len(args):
+                sys.exit(f'{opt} needs an archive name or - for stdout')
+            archive = (opt, args[i + 1])
+            del args[i: i + 2]
 
-    image.close()
+    unpack(args[0], trim, archive=archive)
 
 if __name__ == "__main__":
     try: